@@ -22,8 +22,11 @@ along with wrfplot. If not, see <http://www.gnu.org/licenses/>.
 __author__ = "J Sundar (wrf.guy@gmail.com)"
 
 import os
+import sys
 import cartopy
 import shutil
+import filecmp
+import numpy as np
 from pathlib import Path
 
 
@@ -143,6 +146,79 @@ def plot_animation_with_speed(input_path, output_dir):
         return False
 
 
+def check_float32_clevels(input_path, variables=("T2", "slp", "rh2", "mcape", "ppn"), rtol=1e-3):
+    """
+    Check that contour levels of data processed in float32 match the ones of float64 within tolerance
+    """
+    sys.path.insert(0, os.path.dirname(wrfplot_path))
+    import utils
+    from core import WrfPlot
+
+    matched = True
+    for var_name in variables:
+        levels = {}
+        for precision in ["float64", "float32"]:
+            wrfplt = WrfPlot(input_path=input_path, precision=precision)
+            wrfplt.read_file(input_path)
+            wrfplt.set_variable(var_name)
+            levels[precision] = []
+            for idx_time in wrfplt.get_selected_times():
+                data = wrfplt.extract_fields(var_name, idx_time=idx_time)[0]
+                # Levels are found the same way as while making map
+                if wrfplt.config[var_name].clevels == "auto":
+                    clevels = utils.get_auto_clevel(data=data)
+                else:
+                    clevels = wrfplt.set_clevels(var_name=var_name, var_data=data)
+                levels[precision].append(np.asarray(clevels, dtype=np.float64))
+        for clevels_64, clevels_32 in zip(levels["float64"], levels["float32"]):
+            if clevels_64.shape != clevels_32.shape or not np.allclose(
+                clevels_64, clevels_32, rtol=rtol
+            ):
+                print("Contour levels of '%s' differ in float32 mode..." % var_name)
+                matched = False
+                break
+    if matched:
+        print("Contour levels of float32 mode match the ones of float64...")
+
+    return matched
+
+
+def check_parallel_output(input_path, output_dir, variables="T2,slp,u_temp", workers=2):
+    """
+    Check that images plotted with a pool of worker processes are byte for byte same as the ones plotted serially
+    """
+    output_dirs = {}
+    for mode, options in [("serial", []), ("parallel", ["--workers", str(workers)])]:
+        output_dirs[mode] = os.path.join(output_dir, mode)
+        if os.path.exists(output_dirs[mode]):
+            shutil.rmtree(output_dirs[mode])
+        os.makedirs(output_dirs[mode])
+        cmd_options = [
+            wrfplot_path,
+            "--vars",
+            variables,
+            "--ulevels",
+            "850,500",
+            "--input",
+            input_path,
+            "--output",
+            output_dirs[mode],
+        ] + options
+        if os.system("python " + " ".join(cmd_options)) != 0:
+            print("Failed to plot in %s mode..." % mode)
+            return False
+    images = sorted(os.listdir(output_dirs["serial"]))
+    _, mismatch, errors = filecmp.cmpfiles(
+        output_dirs["serial"], output_dirs["parallel"], images, shallow=False
+    )
+    if len(images) == 0 or mismatch or errors:
+        print("Images plotted in parallel differ from serial ones : %s" % ", ".join(mismatch + errors))
+        return False
+    print("Images plotted in parallel are same as serial ones...")
+
+    return True
+
+
 if __name__ == "__main__":
     home = str(Path.home())
     test_file_path = os.path.realpath(__file__)
@@ -161,4 +237,6 @@ if __name__ == "__main__":
     test(input_path=wrf_input_path, output_dir=output_plot_dir)
     plot_animation(input_path=wrf_input_path, output_dir=output_plot_dir)
     plot_animation_with_speed(input_path=wrf_input_path, output_dir=output_plot_dir)
+    check_float32_clevels(input_path=wrf_input_path)
+    check_parallel_output(input_path=wrf_input_path, output_dir=output_plot_dir)
 
@@ -20,6 +20,7 @@ import os
 import traceback
 from tqdm import tqdm
 import utils
+import encoder
 
 
 def check_img(filename):
@@ -37,13 +38,19 @@ def check_img(filename):
         return False
 
 
-def filter_images(image_paths, type='png'):
-    """Filter images based on the type of image and correctness"""
+def filter_images(image_paths, type='png', frames=None):
+    """Filter images based on the type of image and correctness
+
+    Images already in ``frames`` (path to image) are taken from there without reading their files.
+    """
+    frames = frames or {}
     image_files_list = sorted(image_paths)
     images = []
     for image_path in image_files_list:
         if image_path.endswith(type):
-            if check_img(image_path) is True:
+            if image_path in frames:
+                images.append(frames[image_path])
+            elif check_img(image_path) is True:
                 images.append(Image.open(image_path))
 
     if len(images) > 0:
@@ -51,20 +58,30 @@ def filter_images(image_paths, type='png'):
     return None
 
 
-def make_animation(image_paths, output_file_path, speed=False, file_type='png', loop=True):
-    """Create GIF file from list of images"""
+def make_animation(image_paths, output_file_path, speed=False, file_type='png', loop=True, frames=None,
+                   anim_format='gif', quality=None):
+    """Create animation (GIF by default) from list of images
+
+    Args:
+        image_paths (list): Paths to images
+        output_file_path (str): Path to animation file
+        speed (float): Seconds between images. False to use 0.5 seconds.
+        file_type (str): Extension of images to be used
+        loop (bool): Loop the animation
+        frames (dict): Pixels of images already in memory against their paths, if any
+        anim_format (str): Format of animation i.e., 'gif', 'webp' or 'avif'
+        quality (int): Quality of 'webp' and 'avif' animations. None to use default quality of the format.
+    """
     if speed is False:
         duration_sec = 0.5 * 1000
     else:
         duration_sec = speed * 1000
-    images = filter_images(image_paths, type=file_type)
+    images = filter_images(image_paths, type=file_type, frames=frames)
     if images is not None:
         try:
-            img = images[0]  # next(images)
-            img.save(fp=output_file_path, format='GIF', append_images=images, save_all=True, duration=duration_sec,
-                     loop=0, optimize=True)
+            encoder.save_animation(images, output_file_path, duration_sec, fmt=anim_format, quality=quality)
             if os.path.exists(output_file_path):
-                tqdm.write(f"\nAnimation (GIF) file created at : {utils.quote(output_file_path)}")
+                tqdm.write(f"\nAnimation ({anim_format.upper()}) file created at : {utils.quote(output_file_path)}")
         except Exception as e:
             tqdm.write(traceback.format_exc())
             tqdm.write(f"Failed to create animation. {e}...")
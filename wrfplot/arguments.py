@@ -19,10 +19,10 @@ __author__ = "J Sundar (wrf.guy@gmail.com)"
 
 import os
 import argparse
-import configparser
+import importlib.util
+import numpy as np
 import utils
-import colormaps as cmaps
-import matplotlib.pyplot as plt
+import variables
 
 
 def dir_path(path):
@@ -66,6 +66,27 @@ def file_path(path):
         )
 
 
+def input_paths(path):
+    """Validate input file(s) provided as path to a file, directory, glob pattern or list of files separated by ','
+
+    Args:
+        path: Path to input file(s)
+
+    Results:
+        list: Path to each input file if all are valid or else ArgumentTypeError
+    """
+
+    files = utils.dir_to_list_files(path)
+    if len(files) == 0:
+        raise argparse.ArgumentTypeError(
+            f"Input path provided '{path}' does not contain any file..."
+        )
+    for _file in files:
+        file_path(_file)
+
+    return files
+
+
 def validate_vars(input_vars):
     """Validate user provided input variables and return only variables that are supported by the application
 
@@ -78,11 +99,10 @@ def validate_vars(input_vars):
 
     final_vars = []
     non_supported = []
-    config = configparser.ConfigParser()
-    config.read(os.path.join(utils.data_dir(), "wrf_variables.ini"))
+    registry = variables.get_registry()
     # Check if input variable contain multiple paramters
     if "," not in input_vars:
-        if input_vars in config.sections():
+        if input_vars in registry:
             return input_vars
         else:
             raise argparse.ArgumentTypeError(
@@ -91,7 +111,7 @@ def validate_vars(input_vars):
     # Split the variables in to list and check for
     vars = input_vars.split(",")
     for var in vars:
-        if var in config.sections():
+        if var in registry:
             final_vars.append(var)
         else:
             non_supported.append(var)
@@ -112,24 +132,23 @@ def validate_vars(input_vars):
 def list_vars():
     """List supported variable names on terminal"""
 
-    config = configparser.ConfigParser()
-    config.read(os.path.join(utils.data_dir(), "wrf_variables.ini"))
+    registry = variables.get_registry()
     print("\n****    ****    ****    ****    ****    ****    ****")
     print(
         "Variables starting with 'u_' are upper air variable availabe at 925, 850, 700, 600, 500, 400, 300 and 200 hPa heights..."
     )
     print("****    ****    ****    ****    ****    ****    ****\n")
-    for var in config.sections():
+    for var, spec in registry.items():
         print(
             "Variable " + utils.quote(var),
-            "  --> " + config.get(var, "title") + " (" + config.get(var, "unit") + ")",
+            "  --> " + spec.title + " (" + spec.unit + ")",
         )
     print("")
 
 
 def list_cmaps():
     """Print list of available colormaps on terminal"""
-    cmap_methods = dir(cmaps)
+    cmap_methods = sorted(utils.get_cmap_index())
     print(cmap_methods)
     return cmap_methods
 
@@ -143,7 +162,7 @@ def validate_cmap(cmap):
     Results:
         str: Name of colormap if supported
     """
-    if cmap not in dir(cmaps) + plt.colormaps():
+    if cmap not in utils.get_cmap_index():
         print(f"\nColormap {utils.quote(cmap)} is not supported by wrfplot."
               f"\nUse '--list-cmaps' option to find list of supported colormaps.")
         return False
@@ -252,3 +271,258 @@ def validate_gif_speed(seconds):
         print("\nInvalid gif speed:", utils.quote(seconds))
         print("Defaulting to GIF animation speed to '0.5' seconds.")
         return 0.5
+
+
+def validate_cache_size(size):
+    """Validate user provided size of field cache
+
+    Args:
+        size: Size of cache in MB
+    Result:
+        int: Size of cache in MB after validation
+    """
+    if size.isdigit():
+        return int(size)
+    else:
+        raise argparse.ArgumentTypeError(
+            f"Cache size provided '{size}' is not a valid number of MB..."
+        )
+
+
+def validate_times(times):
+    """Validate user provided forecast hours
+
+    Forecast hours are counted from the first time of input file(s). Each item separated by ',' can be a single hour
+    i.e., '12', a range i.e., '0-48' or a range with a step i.e., '0-48:3'.
+
+    Args:
+        times (str): Forecast hours
+    Result:
+        list: List of (start, stop, step) forecast hour ranges with inclusive stop
+    """
+    hour_ranges = []
+    for item in times.split(","):
+        item = item.strip()
+        _range, _, step = item.partition(":")
+        start, _, stop = _range.partition("-")
+        stop = stop if stop else start
+        step = step if step else "1"
+        if not (start.isdigit() and stop.isdigit() and step.isdigit()) or int(step) == 0:
+            raise argparse.ArgumentTypeError(
+                f"Forecast hour(s) provided '{item}' is not valid. Use format like '12', '0-48' or '0-48:3'..."
+            )
+        if int(start) > int(stop):
+            raise argparse.ArgumentTypeError(
+                f"Start of forecast hour range '{item}' can not be more than its end..."
+            )
+        hour_ranges.append((int(start), int(stop), int(step)))
+
+    return hour_ranges
+
+
+def validate_valid(valid):
+    """Validate user provided valid times
+
+    Args:
+        valid (str): Valid times in 'YYYY-MM-DDTHH[:MM]' format separated by ','
+    Result:
+        list: List of valid times as numpy datetime64
+    """
+    valid_times = []
+    for item in valid.split(","):
+        item = item.strip().replace("_", "T")
+        try:
+            valid_times.append(np.datetime64(item, "m"))
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                f"Valid time provided '{item}' is not valid. Use format like '2021-05-13T12' or '2021-05-13T12:30'..."
+            )
+
+    return valid_times
+
+
+def validate_bbox(bbox):
+    """Validate user provided bounding box
+
+    Args:
+        bbox (str): Bounding box as 'lon0,lon1,lat0,lat1' in degrees
+    Result:
+        list: Bounding box as [lon0, lon1, lat0, lat1]
+    """
+    try:
+        lon0, lon1, lat0, lat1 = [float(item) for item in bbox.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"Bounding box provided '{bbox}' is not valid. Use format like '70,90,5,25' i.e., 'lon0,lon1,lat0,lat1'..."
+        )
+    if not (lon0 < lon1 and lat0 < lat1):
+        raise argparse.ArgumentTypeError(
+            f"Bounding box provided '{bbox}' is not valid. 'lon0' and 'lat0' must be less than 'lon1' and 'lat1'..."
+        )
+    if not (-90 <= lat0 and lat1 <= 90):
+        raise argparse.ArgumentTypeError(
+            f"Bounding box provided '{bbox}' is not valid. Latitudes must be between -90 and 90..."
+        )
+
+    return [lon0, lon1, lat0, lat1]
+
+
+def validate_coarsen(factor):
+    """Validate user provided coarsening factor
+
+    Args:
+        factor (str): 'auto' or number of grid points along each direction to be merged into one
+    Result:
+        int: Coarsening factor or None for 'auto'
+    """
+    if factor.strip().lower() == "auto":
+        return None
+    try:
+        _factor = int(factor)
+    except ValueError:
+        _factor = 0
+    if _factor < 1:
+        raise argparse.ArgumentTypeError(
+            f"Coarsening factor provided '{factor}' is not valid. Use 'auto' or a whole number greater than 0..."
+        )
+
+    return _factor
+
+
+def validate_png_compression(level):
+    """Validate user provided zlib compression level of PNG images
+
+    Args:
+        level (str): Compression level from 0 (no compression) to 9 (maximum compression)
+    Result:
+        int: Compression level
+    """
+    try:
+        _level = int(level)
+    except ValueError:
+        _level = -1
+    if not 0 <= _level <= 9:
+        raise argparse.ArgumentTypeError(
+            f"PNG compression level provided '{level}' is not valid. Use a whole number from 0 to 9..."
+        )
+
+    return _level
+
+
+def validate_format(fmt):
+    """Validate user provided format of images
+
+    Args:
+        fmt (str): Format of images i.e., 'png', 'webp', 'jpeg' or 'avif'
+    Result:
+        str: Format of images
+    """
+    import encoder
+
+    _fmt = fmt.strip().lower().replace("jpg", "jpeg")
+    if _fmt not in encoder.FORMATS:
+        raise argparse.ArgumentTypeError(
+            f"Image format provided '{fmt}' is not valid. Use one of {', '.join(encoder.FORMATS)}..."
+        )
+    if _fmt not in encoder.available_formats():
+        raise argparse.ArgumentTypeError(
+            f"Image format '{fmt}' is not supported by the installed Pillow. Install Pillow built with {_fmt} "
+            f"support or use one of {', '.join(encoder.available_formats())}..."
+        )
+
+    return _fmt
+
+
+def validate_quality(quality):
+    """Validate user provided quality of lossy image formats
+
+    Args:
+        quality (str): Quality from 1 (smallest files) to 100 (best quality)
+    Result:
+        int: Quality
+    """
+    try:
+        _quality = int(quality)
+    except ValueError:
+        _quality = 0
+    if not 1 <= _quality <= 100:
+        raise argparse.ArgumentTypeError(
+            f"Quality provided '{quality}' is not valid. Use a whole number from 1 to 100..."
+        )
+
+    return _quality
+
+
+def validate_zooms(zooms):
+    """Validate user provided zoom levels of tiles
+
+    Args:
+        zooms (str): Lowest and highest zoom levels separated by '-' e.g. '4-9' or a single zoom level
+    Result:
+        tuple: Lowest and highest zoom levels
+    """
+    import tiles
+
+    try:
+        _zooms = [int(zoom) for zoom in zooms.split("-")]
+    except ValueError:
+        _zooms = []
+    if len(_zooms) == 1:
+        _zooms = _zooms * 2
+    if (
+        len(_zooms) != 2
+        or not 0 <= _zooms[0] <= _zooms[1] <= tiles.MAX_ZOOM
+    ):
+        raise argparse.ArgumentTypeError(
+            f"Zoom levels provided '{zooms}' are not valid. Use lowest and highest zoom levels from 0 to "
+            f"{tiles.MAX_ZOOM} separated by '-' e.g. '4-9'..."
+        )
+
+    return tuple(_zooms)
+
+
+def validate_workers(workers):
+    """Validate user provided number of worker processes
+
+    Args:
+        workers (str): Number of worker processes or 'auto' for number of CPUs
+    Result:
+        int: Number of worker processes
+    """
+    if workers.strip().lower() == "auto":
+        return os.cpu_count() or 1
+    try:
+        _workers = int(workers)
+    except ValueError:
+        _workers = 0
+    if _workers < 1:
+        raise argparse.ArgumentTypeError(
+            f"Number of workers provided '{workers}' is not valid. Use 'auto' or a whole number greater than 0..."
+        )
+
+    return _workers
+
+
+def validate_export(fmt):
+    """Validate user provided format of exported data
+
+    Args:
+        fmt (str): 'geotiff' or 'netcdf'
+    Result:
+        str: Format of exported data
+    """
+    import export
+
+    _fmt = fmt.lower()
+    if _fmt not in export.FORMATS:
+        raise argparse.ArgumentTypeError(
+            f"Export format provided '{fmt}' is not valid. Use one of {', '.join(export.FORMATS)}..."
+        )
+    package = export.REQUIRES[_fmt]
+    if package is not None and importlib.util.find_spec(package) is None:
+        raise argparse.ArgumentTypeError(
+            f"Export format provided '{fmt}' needs '{package}' package which is not installed. Install it with "
+            f"'pip install {package}'..."
+        )
+
+    return _fmt
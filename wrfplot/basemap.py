@@ -0,0 +1,515 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Draw static layers of maps (world shape, grid lines and their labels) once and reuse them for every map """
+"""
+This file is part of wrfplot application.
+
+wrfplot is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as
+ published by the Free Software Foundation, either version 3 of the License, or any later version.
+
+wrfplot is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with wrfplot. If not,
+see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "J Sundar (wrf.guy@gmail.com)"
+
+import os
+import hashlib
+import numpy as np
+import shapely
+import cartopy.crs as ccrs
+from collections import OrderedDict
+from cartopy.feature import ShapelyFeature
+from cartopy.geodesic import Geodesic
+from cartopy.io.shapereader import Reader
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.image import AxesImage
+import cache
+import utils
+
+# Number of basemaps kept in memory. Each one holds an image of the size of the map.
+MAX_BASEMAPS = 8
+# Directory where shapes clipped to the domain and projected to its projection are kept across runs
+DEFAULT_SHAPE_CACHE_DIR = os.path.join("~", ".cache", "wrfplot", "shapes")
+# Margin around the extent of the map, as a fraction of its size, kept while clipping shapes
+SHAPE_MARGIN = 0.05
+# Resolutions of Natural Earth shapes from coarse to fine along with the smallest size of a pixel of the map in metres
+# for which the resolution is chosen automatically. Finest resolution is chosen for smaller pixels.
+SHAPE_RESOLUTIONS = [("110m", 4000.0), ("50m", 500.0), ("10m", 0.0)]
+# Tolerance in degrees for simplifying borders of countries to match resolution of coastlines
+BORDER_TOLERANCE = {"110m": 0.05, "10m": 0.0}
+# Distance in degrees from coastlines within which boundaries of countries are taken as coastlines and not borders
+COAST_BUFFER = 0.01
+# Static layers are drawn over filled contours and below contour lines, same as the world shape feature
+BASEMAP_ZORDER = 1.5
+# Labels of grid lines are drawn over contour lines (zorder 2) and below contour labels. Contour lines are added before
+# static layers on a new figure and after them on the following maps. Having no tie in zorder with them draws the
+# labels the same way irrespective of the maps plotted previously on the figure.
+LABEL_ZORDER = 2.5
+
+_basemaps = OrderedDict()  # Basemaps drawn so far
+
+
+def add_shp_features(ax, shape_cache_dir=DEFAULT_SHAPE_CACHE_DIR, shape_res="auto"):
+    """Read shapefiles and add coastlines and borders of countries as cartopy features
+
+    Countries of 'world_shape' shapefile are drawn at 50m resolution. At other resolutions, coastlines are read from
+    Natural Earth shapefiles of the resolution and only borders are taken from 'world_shape'. Shapes are clipped to the
+    extent of the axes and projected to its projection only once for a domain. They are reused from
+    ``shape_cache_dir`` afterwards.
+
+    Args:
+        ax (GeoAxes): Axes with its extent set
+        shape_cache_dir (str): Path to directory of shapes clipped to domains. None to not keep them on disk.
+        shape_res (str): Resolution of shapes i.e., '110m', '50m', '10m' or 'auto' to choose it from size of a pixel
+    """
+    if shape_res == "auto":
+        shape_res = auto_resolution(ax)
+    xlim, ylim = ax.get_xlim(), ax.get_ylim()
+    wld_shp_f = os.path.join(utils.data_dir(), "shape", "world_shape.shp")
+    coast_file, shape_res = shape_file("coastline", shape_res)
+    if shape_res == "50m":
+        shapes = get_shapes(wld_shp_f, ax.projection, xlim, ylim, shape_cache_dir)
+    else:
+        shapes = get_shapes(coast_file, ax.projection, xlim, ylim, shape_cache_dir)
+        # Countries of 'world_shape' have same coastlines as Natural Earth shapes of 50m resolution
+        shapes.extend(
+            get_shapes(
+                wld_shp_f,
+                ax.projection,
+                xlim,
+                ylim,
+                shape_cache_dir,
+                exclude=shape_file("coastline", "50m")[0],
+                tolerance=BORDER_TOLERANCE[shape_res],
+            )
+        )
+    wld_shp_features = ShapelyFeature(shapes, ax.projection, facecolor="none")
+    ax.add_feature(wld_shp_features, linewidth=0.5, edgecolor="black", alpha=0.7)
+
+
+def shape_file(name, resolution):
+    """Find physical Natural Earth shapefile of a resolution, or of the finest coarser resolution available
+
+    Args:
+        name (str): Name of the shapes e.g. 'coastline'
+        resolution (str): Resolution i.e., '110m', '50m' or '10m'
+
+    Returns:
+        tuple: Path to shapefile and its resolution
+    """
+    resolutions = [res for res, _ in SHAPE_RESOLUTIONS]
+    for res in reversed(resolutions[: resolutions.index(resolution) + 1]):
+        _path = os.path.join(
+            utils.data_dir(),
+            "shapefiles",
+            "natural_earth",
+            "physical",
+            "ne_%s_%s.shp" % (res, name),
+        )
+        if os.path.exists(_path):
+            return _path, res
+
+    return _path, res
+
+
+def auto_resolution(ax):
+    """Choose resolution of shapes from size of a pixel of the map
+
+    Coarse shapes are enough for continental or global domains. Fine shapes are needed only when a pixel covers a
+    small distance, such as high resolution nests.
+
+    Args:
+        ax (GeoAxes): Axes with its extent set
+
+    Returns:
+        str: Resolution i.e., '110m', '50m' or '10m'
+    """
+    (x0, x1), (y0, y1) = ax.get_xlim(), ax.get_ylim()
+    # Distance covered by a hundredth of the width of the map at its centre
+    x_mid, y_mid, step = (x0 + x1) / 2.0, (y0 + y1) / 2.0, (x1 - x0) / 200.0
+    points = ccrs.PlateCarree().transform_points(
+        ax.projection, np.array([x_mid - step, x_mid + step]), np.array([y_mid, y_mid])
+    )
+    distance = Geodesic().inverse(points[0, :2], points[1, :2])[0, 0]
+    pixel = distance / max(1.0, ax.bbox.width / 100.0)
+    for resolution, min_pixel in SHAPE_RESOLUTIONS:
+        if not pixel < min_pixel:
+            return resolution
+
+    return SHAPE_RESOLUTIONS[-1][0]
+
+
+def add_grids(ax):
+    """Add grid lines to plot"""
+    grd_lns = ax.gridlines(draw_labels=True, color="gray", alpha=0.5, linestyle="--")
+    grd_lns.top_labels = False
+    grd_lns.right_labels = False
+
+    return grd_lns
+
+
+def get_shapes(shp_file, projection, xlim, ylim, cache_dir=None, exclude=None, tolerance=0.0):
+    """Get outlines of shapes in a shapefile clipped to the extent of a map and projected to its projection
+
+    Clipped outlines are stored as a WKB file in ``cache_dir`` against the shapefiles, projection, extent and
+    tolerance, so that later runs over the same domain only load them. Outlines are clipped in longitude and latitude
+    before projecting them, so that shapes far from the domain are never projected.
+
+    Args:
+        shp_file (str): Path to shapefile having geometries in longitude and latitude
+        projection (CRS): Projection of the map
+        xlim (tuple): Limits of x axis in projection coordinates
+        ylim (tuple): Limits of y axis in projection coordinates
+        cache_dir (str): Path to directory of clipped outlines. None to clip outlines every time.
+        exclude (str): Path to shapefile of lines (e.g. coastlines) to be left out of the outlines, if any
+        tolerance (float): Tolerance in degrees for simplifying outlines. 0 to keep them as they are.
+
+    Returns:
+        list: Clipped outlines as a single MultiLineString in projection coordinates. Empty when no shape falls in
+        the extent.
+    """
+    x_margin = (xlim[1] - xlim[0]) * SHAPE_MARGIN
+    y_margin = (ylim[1] - ylim[0]) * SHAPE_MARGIN
+    rect = (
+        xlim[0] - x_margin,
+        ylim[0] - y_margin,
+        xlim[1] + x_margin,
+        ylim[1] + y_margin,
+    )
+    _path = None
+    shapes = None
+    if cache_dir is not None:
+        cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        key = (
+            [cache.file_signature(_file) for _file in (shp_file, exclude) if _file is not None],
+            projection.proj4_init,
+            tuple(np.round(rect, 3)),
+            tolerance,
+        )
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        _path = os.path.join(cache_dir, digest + ".wkb")
+        try:
+            with open(_path, "rb") as wkb_file:
+                shapes = shapely.from_wkb(wkb_file.read())
+        except (OSError, shapely.errors.ShapelyError):
+            shapes = None
+
+    if shapes is None:
+        excluded = None
+        if exclude is not None:
+            excluded = Reader(exclude).geometries()
+        shapes = clip_shapes(
+            Reader(shp_file).geometries(), projection, rect, excluded, tolerance
+        )
+        if _path is not None:
+            # Worker processes may share the cache directory
+            tmp_path = "%s.%d.tmp" % (_path, os.getpid())
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                with open(tmp_path, "wb") as wkb_file:
+                    wkb_file.write(shapely.to_wkb(shapes))
+                os.replace(tmp_path, _path)
+            except OSError:
+                # Caching is an optimisation. Failing to write should not stop plotting.
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    return [] if shapes.is_empty else [shapes]
+
+
+def lon_lat_bounds(projection, rect):
+    """Find longitude and latitude covered by a rectangle of a projection
+
+    Args:
+        projection (CRS): Projection of the rectangle
+        rect (tuple): Rectangle as (x0, y0, x1, y1) in projection coordinates
+
+    Returns:
+        tuple: Bounds as (lon0, lat0, lon1, lat1). Whole globe when the rectangle crosses the dateline.
+    """
+    x0, y0, x1, y1 = rect
+    lon_lat = ccrs.PlateCarree()
+    # Points along the edges of the rectangle
+    steps = np.linspace(0.0, 1.0, 101)
+    xs = np.concatenate(
+        [x0 + (x1 - x0) * steps, np.full_like(steps, x1), x1 - (x1 - x0) * steps, np.full_like(steps, x0)]
+    )
+    ys = np.concatenate(
+        [np.full_like(steps, y0), y0 + (y1 - y0) * steps, np.full_like(steps, y1), y1 - (y1 - y0) * steps]
+    )
+    points = lon_lat.transform_points(projection, xs, ys)
+    points = points[np.isfinite(points[:, 0]) & np.isfinite(points[:, 1])]
+    bounds = (-180.0, -90.0, 180.0, 90.0)
+    if len(points) > 0 and np.ptp(points[:, 0]) < 180.0:
+        # Edges are straight in projection but not in longitude and latitude. So, keep a degree on all sides.
+        bounds = (
+            np.min(points[:, 0]) - 1.0,
+            np.min(points[:, 1]) - 1.0,
+            np.max(points[:, 0]) + 1.0,
+            np.max(points[:, 1]) + 1.0,
+        )
+    # A pole inside the rectangle is surrounded by all longitudes
+    for pole in [-90.0, 90.0]:
+        x, y = projection.transform_point(0.0, pole, lon_lat)
+        if np.isfinite(x) and np.isfinite(y) and x0 <= x <= x1 and y0 <= y <= y1:
+            bounds = (-180.0, min(bounds[1], pole), 180.0, max(bounds[3], pole))
+
+    return bounds
+
+
+def clip_shapes(geometries, projection, rect, exclude=None, tolerance=0.0):
+    """Clip outlines of geometries to a rectangle of a projection
+
+    Args:
+        geometries: Shapely geometries in longitude and latitude
+        projection (CRS): Projection of the rectangle
+        rect (tuple): Rectangle as (x0, y0, x1, y1) in projection coordinates
+        exclude: Shapely lines in longitude and latitude to be left out of the outlines, if any
+        tolerance (float): Tolerance in degrees for simplifying outlines. 0 to keep them as they are.
+
+    Returns:
+        MultiLineString: Outlines inside the rectangle in projection coordinates
+    """
+    bounds = lon_lat_bounds(projection, rect)
+    # Outlines are clipped rather than shapes, so that clipping does not add edges along the rectangle
+    outlines = clip_outlines(geometries, bounds)
+    if exclude is not None:
+        excluded = clip_outlines(exclude, bounds)
+        if len(excluded) > 0:
+            outlines = remove_near(outlines, excluded, COAST_BUFFER)
+    if tolerance > 0:
+        outlines = shapely.simplify(outlines, tolerance)
+    lines = []
+    for line in shapely.get_parts(outlines):
+        if not isinstance(line, shapely.LineString) or line.is_empty:
+            continue
+        projected = projection.project_geometry(line, ccrs.PlateCarree())
+        lines.extend(
+            part
+            for part in shapely.get_parts(shapely.clip_by_rect(projected, *rect))
+            if isinstance(part, shapely.LineString) and not part.is_empty
+        )
+
+    return shapely.MultiLineString(lines)
+
+
+def remove_near(outlines, lines, distance):
+    """Remove parts of outlines running along lines i.e., segments having both ends within a distance of the lines
+
+    Args:
+        outlines (ndarray): Outlines as lines
+        lines (ndarray): Lines to be removed from outlines
+        distance (float): Distance within which outlines are taken as running along lines
+
+    Returns:
+        ndarray: Remaining parts of outlines as LineStrings
+    """
+    outlines = shapely.get_parts(shapely.get_parts(outlines))
+    coords, line_idx = shapely.get_coordinates(
+        outlines[shapely.get_type_id(outlines) == 1], return_index=True
+    )
+    # Lines are split into segments so that each one is looked up only around its own bounds
+    line_coords, idx = shapely.get_coordinates(shapely.get_parts(lines), return_index=True)
+    same = idx[1:] == idx[:-1]
+    tree = shapely.STRtree(
+        shapely.linestrings(np.stack([line_coords[:-1][same], line_coords[1:][same]], axis=1))
+    )
+    near = np.zeros(len(coords), dtype=bool)
+    near[tree.query(shapely.points(coords), predicate="dwithin", distance=distance)[0]] = True
+
+    # Runs of segments to be kept, within the same outline, make the remaining parts
+    keep = (line_idx[1:] == line_idx[:-1]) & ~(near[1:] & near[:-1])
+    edges = np.diff(np.concatenate([[0], keep.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    lengths = ends - starts + 1  # Points of a run of segments
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths[:-1])]), lengths)
+    points = offsets + np.arange(np.sum(lengths))
+
+    return shapely.get_parts(
+        shapely.linestrings(coords[points], indices=np.repeat(np.arange(len(starts)), lengths))
+    )
+
+
+def clip_outlines(geometries, bounds):
+    """Clip outlines of polygons and lines to bounds of longitude and latitude
+
+    Returns:
+        ndarray: Clipped outlines which are not empty
+    """
+    geometries = np.array([geom for geom in geometries if geom is not None], dtype=object)
+    polygons = np.isin(shapely.get_type_id(geometries), [3, 6])  # Polygon and MultiPolygon
+    geometries[polygons] = shapely.boundary(geometries[polygons])
+    outlines = shapely.clip_by_rect(geometries, *bounds)
+
+    return outlines[~shapely.is_empty(outlines)]
+
+
+def signature(ax, dpi, shape_res="auto"):
+    """Find what the static layers of a map depend on i.e., projection, extent and layout of the axes
+
+    Args:
+        ax (GeoAxes): Axes of the map with its extent set and layout applied
+        dpi (int): Resolution of the saved image
+        shape_res (str): Resolution of shapes i.e., '110m', '50m', '10m' or 'auto'
+
+    Returns:
+        tuple: Projection, x and y limits, figure size, axes position, resolution of image and of shapes
+    """
+    return (
+        ax.projection,
+        tuple(np.round(ax.get_xlim(), 3)),
+        tuple(np.round(ax.get_ylim(), 3)),
+        tuple(ax.figure.get_size_inches()),
+        tuple(np.round(ax.get_position().bounds, 6)),
+        dpi,
+        shape_res,
+    )
+
+
+def get_basemap(key, shape_cache_dir=DEFAULT_SHAPE_CACHE_DIR):
+    """Get static layers of a map for a signature, drawing them if they are not drawn yet
+
+    Args:
+        key (tuple): Signature of the map from ``signature``
+        shape_cache_dir (str): Path to directory of shapes clipped to domains. None to not keep them on disk.
+
+    Returns:
+        Basemap: Static layers of the map
+    """
+    if key in _basemaps:
+        _basemaps.move_to_end(key)
+        return _basemaps[key]
+    _basemap = Basemap.draw(*key, shape_cache_dir=shape_cache_dir)
+    _basemaps[key] = _basemap
+    while len(_basemaps) > MAX_BASEMAPS:
+        _basemaps.popitem(last=False)
+
+    return _basemap
+
+
+class Basemap(object):
+    """Static layers of a map drawn for a projection, extent and layout of the axes
+
+    World shape and grid lines inside the axes are kept as an image of the axes at the resolution of the saved image,
+    so that adding it to a map is a single image instead of projecting and stroking every shape and grid line. Grid
+    line labels are kept as texts with their positions relative to the axes, so that they are laid out with the rest of
+    the figure.
+    """
+
+    def __init__(self, image, extent, labels):
+        """Create basemap
+
+        Args:
+            image (ndarray): RGBA pixels of the static layers inside the axes
+            extent (tuple): Extent of the image in axes coordinates as (left, right, bottom, top)
+            labels (list): Grid line labels as (text, x, y, properties) with position in axes coordinates
+        """
+        super(Basemap, self).__init__()
+        self.image = image
+        self.extent = extent
+        self.labels = labels
+
+    @classmethod
+    def draw(
+        cls,
+        projection,
+        xlim,
+        ylim,
+        size,
+        position,
+        dpi,
+        shape_res="auto",
+        shape_cache_dir=DEFAULT_SHAPE_CACHE_DIR,
+    ):
+        """Draw static layers on a figure of its own having same size and axes layout as the map
+
+        Args:
+            projection (CRS): Projection of the map
+            xlim (tuple): Limits of x axis in projection coordinates
+            ylim (tuple): Limits of y axis in projection coordinates
+            size (tuple): Size of the figure in inches
+            position (tuple): Position of the axes in figure coordinates as (left, bottom, width, height)
+            dpi (int): Resolution of the saved image
+            shape_res (str): Resolution of shapes i.e., '110m', '50m', '10m' or 'auto'
+            shape_cache_dir (str): Path to directory of shapes clipped to domains. None to not keep them on disk.
+
+        Returns:
+            Basemap: Static layers of the map
+        """
+        fig = Figure(figsize=size, dpi=dpi)
+        FigureCanvasAgg(fig)
+        fig.patch.set_alpha(0)
+        ax = fig.add_axes(position, projection=projection)
+        # Position is already fitted to the extent of the map
+        ax.set_aspect("auto")
+        ax.set_xlim(xlim)
+        ax.set_ylim(ylim)
+        ax.patch.set_visible(False)
+        ax.spines["geo"].set_visible(False)
+        add_shp_features(ax, shape_cache_dir, shape_res)
+        grd_lns = add_grids(ax)
+        fig.canvas.draw()
+
+        # Labels are laid out with the figure. Therefore, they are collected and left out of the image.
+        labels = []
+        to_axes = ax.transAxes.inverted()
+        for label in grd_lns.label_artists:
+            if not label.get_visible():
+                continue
+            x, y = to_axes.transform(label.get_transform().transform(label.get_position()))
+            properties = dict(
+                color=label.get_color(),
+                fontproperties=label.get_fontproperties().copy(),
+                horizontalalignment=label.get_horizontalalignment(),
+                verticalalignment=label.get_verticalalignment(),
+                rotation=label.get_rotation(),
+                rotation_mode=label.get_rotation_mode(),
+                zorder=LABEL_ZORDER,
+            )
+            labels.append((label.get_text(), x, y, properties))
+        grd_lns.xlabel_style["alpha"] = 0
+        grd_lns.ylabel_style["alpha"] = 0
+        fig.canvas.draw()
+
+        # Crop whole pixels covering the axes
+        pixels = np.asarray(fig.canvas.buffer_rgba())
+        height = pixels.shape[0]
+        x0, y0, x1, y1 = ax.bbox.extents
+        x0, x1 = int(np.floor(x0)), int(np.ceil(x1))
+        y0, y1 = int(np.floor(y0)), int(np.ceil(y1))
+        image = pixels[height - y1 : height - y0, x0:x1].copy()
+        (left, bottom), (right, top) = ax.transAxes.inverted().transform(
+            [[x0, y0], [x1, y1]]
+        )
+
+        return cls(image, (left, right, bottom, top), labels)
+
+    def add_to(self, ax):
+        """Add static layers to axes of a map having same signature as the basemap
+
+        Returns:
+            list: Artists added to the axes
+        """
+        image = AxesImage(
+            ax,
+            origin="upper",
+            interpolation="nearest",
+            extent=self.extent,
+            transform=ax.transAxes,
+            zorder=BASEMAP_ZORDER,
+        )
+        image.set_data(self.image)
+        image.set_clip_path(ax.patch)
+        artists = [ax.add_artist(image)]
+        for text, x, y, properties in self.labels:
+            artists.append(
+                ax.text(x, y, text, transform=ax.transAxes, clip_on=False, **properties)
+            )
+
+        return artists
@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Cache fields computed from WRF model output so that they are shared across variables """
+"""
+This file is part of wrfplot application.
+
+wrfplot is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as
+ published by the Free Software Foundation, either version 3 of the License, or any later version.
+
+wrfplot is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with wrfplot. If not,
+see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "J Sundar (wrf.guy@gmail.com)"
+
+import os
+import hashlib
+import zipfile
+import numpy as np
+from collections import OrderedDict
+
+# Default upper limit of memory held by the field cache in mega bytes
+DEFAULT_CACHE_SIZE = 512
+# Default upper limit of memory in mega bytes used by a block of times in bulk extraction mode
+DEFAULT_MEMORY_BUDGET = 256
+# Default upper limit of disk space in mega bytes used by the persistent cache
+DEFAULT_DISK_CACHE_SIZE = 2048
+
+
+def field_nbytes(value):
+    """Find number of bytes held by a cached field
+
+    Args:
+        value: numpy array, xarray DataArray or a list/tuple of them
+
+    Returns:
+        int: Size of the field in bytes
+    """
+
+    if isinstance(value, (list, tuple)):
+        return sum(field_nbytes(_value) for _value in value)
+
+    return int(getattr(value, "nbytes", 0))
+
+
+class FieldCache(object):
+    """Least recently used cache of fields limited by the total size of fields in bytes
+
+    Fields are stored against a key such as ``(diagnostic, time index, units)``. When total size of stored fields go
+    beyond ``max_bytes``, least recently used fields are removed until the new field fits in.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        """Create cache
+
+        Args:
+            max_size (int): Maximum size of cache in mega bytes. 0 disables the cache.
+        """
+        super(FieldCache, self).__init__()
+        self.max_bytes = int(max_size * 1024 * 1024)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._fields = OrderedDict()
+        self._pinned = {}  # Number of pins of each pinned key
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __len__(self):
+        return len(self._fields)
+
+    def get(self, key):
+        """Get a field from cache and mark it as most recently used
+
+        Args:
+            key (tuple): Key of the field
+
+        Returns:
+            Field stored against key or None if it is not available
+        """
+        if key in self._fields:
+            self.hits = self.hits + 1
+            self._fields.move_to_end(key)
+            return self._fields[key][0]
+
+        self.misses = self.misses + 1
+        return None
+
+    def put(self, key, value):
+        """Store a field in cache
+
+        Fields larger than the cache itself are not stored.
+
+        Args:
+            key (tuple): Key of the field
+            value: Field to be stored
+        """
+        size = field_nbytes(value)
+        if key in self._fields:
+            self.nbytes = self.nbytes - self._fields.pop(key)[1]
+        if size > self.max_bytes and key not in self._pinned:
+            return
+        self.evict(size)
+        self._fields[key] = (value, size)
+        self.nbytes = self.nbytes + size
+
+    def evict(self, size=0):
+        """Remove least recently used fields which are not pinned until ``size`` bytes more fit in the cache"""
+        for key in list(self._fields):
+            if self.nbytes + size <= self.max_bytes:
+                break
+            if key in self._pinned:
+                continue
+            self.nbytes = self.nbytes - self._fields.pop(key)[1]
+            self.evictions = self.evictions + 1
+
+    def pin(self, key):
+        """Keep a field in cache until it is unpinned
+
+        Pinned fields are stored even when they do not fit in the cache and are never removed to make room for other
+        fields. Used for fields which are known to be needed again, e.g. 'pressure' shared by upper air variables.
+
+        Args:
+            key (tuple): Key of the field. Field need not be in cache yet.
+        """
+        self._pinned[key] = self._pinned.get(key, 0) + 1
+
+    def unpin(self, key):
+        """Release a pin of a field. Field is treated as any other field once all of its pins are released."""
+        count = self._pinned.pop(key, 0) - 1
+        if count > 0:
+            self._pinned[key] = count
+        else:
+            self.evict()
+
+    def get_or_compute(self, key, func, *args, **kwargs):
+        """Get a field from cache or compute and store it if not available
+
+        Args:
+            key (tuple): Key of the field
+            func (callable): Function which computes the field when it is not in cache
+
+        Returns:
+            Field stored against key
+        """
+        value = self.get(key)
+        if value is None:
+            value = func(*args, **kwargs)
+            self.put(key, value)
+
+        return value
+
+    def clear(self):
+        """Remove all fields from cache. Counters are not reset."""
+        self._fields.clear()
+        self.nbytes = 0
+
+    def summary(self):
+        """Summary of cache usage
+
+        Returns:
+            str: Number of hits, misses and evictions of the cache
+        """
+        total = self.hits + self.misses
+        ratio = (100.0 * self.hits / total) if total > 0 else 0.0
+
+        return (
+            "Field cache : %d hits, %d misses (%.1f%% hit rate), %d evictions, %.1f MB in use"
+            % (self.hits, self.misses, ratio, self.evictions, self.nbytes / (1024.0 * 1024.0))
+        )
+
+
+def file_signature(path, attributes=None):
+    """Create a signature identifying contents of an input file
+
+    Signature is made of absolute path, size and modification time of the file along with global attributes of WRF
+    output (e.g. 'SIMULATION_START_DATE', 'DX', 'GRID_ID'). Any change to the file produces a different signature.
+
+    Args:
+        path (str): Path to input file
+        attributes (dict): Global attributes of the file
+
+    Returns:
+        str: Hex digest of the signature
+    """
+    stat = os.stat(path)
+    parts = [os.path.abspath(path), str(stat.st_size), str(stat.st_mtime_ns)]
+    if attributes is not None:
+        for attr in sorted(attributes):
+            parts.append("%s=%s" % (attr, attributes[attr]))
+
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def files_signature(paths, attributes):
+    """Create a signature identifying contents of a set of input files
+
+    Args:
+        paths (list): Path to each input file
+        attributes (list): Global attributes of each file
+
+    Returns:
+        str: Hex digest of the signature. Same as ``file_signature`` for a single file.
+    """
+    signatures = [file_signature(path, attrs) for path, attrs in zip(paths, attributes)]
+    if len(signatures) == 1:
+        return signatures[0]
+
+    return hashlib.sha1("\n".join(signatures).encode("utf-8")).hexdigest()
+
+
+class DiskCache(object):
+    """Persistent cache of extracted fields stored as compressed NPZ files
+
+    Each entry holds data, U component and V component of a variable for a level and time. Entries are removed in
+    least recently used order when total size of the cache directory goes beyond ``max_size``. Total size is kept
+    track of while saving entries, so that the cache directory is scanned only when it is full.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_DISK_CACHE_SIZE):
+        """Create cache
+
+        Args:
+            cache_dir (str): Path to directory where cached fields are stored
+            max_size (int): Maximum size of cache directory in mega bytes
+        """
+        super(DiskCache, self).__init__()
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_bytes = int(max_size * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        self.nbytes = sum(size for _, size, _ in self.entries())  # Total size of entries in bytes
+
+    def path(self, key):
+        """Path of the cache file for a key
+
+        Args:
+            key (tuple): Key made of file signature, variable, level, time and other extraction options
+
+        Returns:
+            str: Path to NPZ file
+        """
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+        return os.path.join(self.cache_dir, digest + ".npz")
+
+    def contains(self, key):
+        """Check if fields of a key are stored in cache without loading them"""
+        return os.path.exists(self.path(key))
+
+    def load(self, key):
+        """Load fields stored against a key
+
+        Args:
+            key (tuple): Key of the fields
+
+        Returns:
+            tuple: Data, U component and V component (None when not stored) or None if key is not in cache. Fields
+            are returned as ``xarray.DataArray`` so that they behave like the ones returned by ``wrf.getvar``.
+        """
+        # Imported here so that command line options are parsed without importing xarray
+        import xarray as xr
+
+        _path = self.path(key)
+        try:
+            with np.load(_path, allow_pickle=False) as npz:
+                fields = tuple(
+                    xr.DataArray(npz[name], name=name) if name in npz.files else None
+                    for name in ("data", "u", "v")
+                )
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            self.misses = self.misses + 1
+            return None
+        # Update modification time to mark the entry as recently used
+        os.utime(_path, None)
+        self.hits = self.hits + 1
+
+        return fields
+
+    def save(self, key, fields):
+        """Store fields against a key and remove older entries if cache is full
+
+        Args:
+            key (tuple): Key of the fields
+            fields (tuple): Data, U component and V component. Components can be None.
+        """
+        arrays = {}
+        for name, field in zip(("data", "u", "v"), fields):
+            if field is not None:
+                arrays[name] = to_array(field)
+        _path = self.path(key)
+        # Worker processes may share the cache directory
+        tmp_path = "%s.%d.tmp" % (_path, os.getpid())
+        try:
+            old_size = os.path.getsize(_path) if os.path.exists(_path) else 0
+            with open(tmp_path, "wb") as tmp_file:
+                np.savez_compressed(tmp_file, **arrays)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, _path)
+        except OSError:
+            # Caching is an optimisation. Failing to write should not stop plotting.
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.nbytes = self.nbytes + size - old_size
+        if self.nbytes > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        """Scan cache directory for entries
+
+        Returns:
+            list: Modification time, size and path of each entry
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npz"):
+                continue
+            _path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, _path))
+
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until cache fits in its size limit
+
+        Total size is found afresh from the cache directory, which also takes entries saved by other processes
+        sharing the directory into account.
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        while entries and total > self.max_bytes:
+            _, size, _path = entries.pop(0)
+            try:
+                os.remove(_path)
+            except OSError:
+                continue
+            total = total - size
+            self.evictions = self.evictions + 1
+        self.nbytes = total
+
+    def summary(self):
+        """Summary of cache usage
+
+        Returns:
+            str: Number of hits, misses and evictions of the cache
+        """
+        return "Disk cache : %d hits, %d misses, %d evictions at %s" % (
+            self.hits,
+            self.misses,
+            self.evictions,
+            self.cache_dir,
+        )
+
+
+def to_array(field):
+    """Convert a field to plain numpy array suitable for storing on disk
+
+    Masked values are replaced with NaN.
+    """
+    data = getattr(field, "values", field)
+    if np.ma.isMaskedArray(data):
+        data = np.ma.filled(data.astype(np.result_type(data.dtype, np.float32)), np.nan)
+
+    return np.asarray(data)
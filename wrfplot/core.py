@@ -22,15 +22,16 @@ __author__ = "J Sundar (wrf.guy@gmail.com)"
 
 import os
 from tqdm import tqdm
-import netCDF4 as nc
 import numpy as np
 import wrf
-from wrf import getvar, get_cartopy, interplevel, latlon_coords, ALL_TIMES
-from configparser import ConfigParser
+from wrf import getvar, get_cartopy, interplevel, latlon_coords, to_np, ALL_TIMES
 import utils
-import plot
-import animation
+import encoder
+import export
 import convert
+import cache
+import fileio
+import variables
 from datetime import datetime
 import warnings
 import matplotlib
@@ -41,6 +42,13 @@ warnings.filterwarnings("ignore", module="datetime")
 
 
 class WrfPlot:
+    # Diagnostics computed from horizontal derivatives of fields
+    full_grid_diagnostics = ["avo", "pvo", "updraft_helicity"]
+    # Pressure levels (hPa) of upper air variables when not given by user
+    default_ulevels = [925, 850, 700, 600, 500, 400, 300, 200]
+    # Upper limit of bytes of pixels of saved maps kept for animations. Maps beyond it are read back from their files.
+    frame_budget = 256 * 1024 * 1024
+
     def __init__(
         self,
         input_path,
@@ -53,8 +61,24 @@ class WrfPlot:
         animation_speed=0.5,
         clevels=False,
         dis_clabel=False,
+        cache_size=cache.DEFAULT_CACHE_SIZE,
+        extraction="frame",
+        memory_budget=cache.DEFAULT_MEMORY_BUDGET,
+        disk_cache_dir=None,
+        disk_cache_size=cache.DEFAULT_DISK_CACHE_SIZE,
+        coarsen=None,
+        precision="float64",
+        shape_res="auto",
+        render="contour",
+        png_compression=encoder.PNG_COMPRESSION,
+        png_palette=False,
+        fig_format="png",
+        quality=None,
+        tiles=None,
+        export=None,
     ):
         self.nc_fh = None
+        self.files = None
         self.valid_input = None
         self.input = input_path
         self.output = output_path
@@ -63,6 +87,7 @@ class WrfPlot:
         self.lats = None
         self.lons = None
         self.date_time = []
+        self.time_indices = None
         self.ulevels = ulevels
         self.proj = None
         self.clevels = clevels
@@ -70,55 +95,313 @@ class WrfPlot:
         self.config = self.read_default_config()
         self.dpi = dpi
         self.cmap = cmap
-        self.animation = animation
+        # Fields cut into tiles or exported as data are not animated
+        self.animation = animation if tiles is None and export is None else False
         self.speed = animation_speed
+        self.fig_format = fig_format
+        self.quality = quality
+        self.export = export
+        self.exporter = None
         self.custom_title = None
-        self.plot = plot.PlotMap(
+        # Pixels of saved maps are kept for animations so that images are not read back from disk
+        self.keep_frames = self.animation is not False
+        self.frames = {}  # Pixels of saved maps against their path, until their animation is made
+        self.frames_nbytes = 0  # Bytes of pixels in frames
+        self.plot_options = dict(
             output_dir=output_path,
             dpi=dpi,
             clevels=clevels,
             config_file=self.config,
             disable_clabel=dis_clabel,
+            coarsen=coarsen,
+            shape_res=shape_res,
+            render=render,
+            png_compression=png_compression,
+            png_palette=png_palette,
+            fig_format=fig_format,
+            quality=quality,
+            tiles=tiles,
         )
+        if disk_cache_dir:
+            # Shapes clipped to the domain are kept along with the disk cache when it is enabled
+            self.plot_options["shape_cache_dir"] = os.path.join(disk_cache_dir, "shapes")
+        # Exported data is not plotted on any map
+        self.plot = self.new_plot() if export is None else None
+        self.user_options = (cmap, clevels)  # Colour map and contour levels given by user
+        self.variable_states = {}  # Map, colour map and contour levels of each variable activated
         self.total_vars = 1
         self.is_moving_domain = None
+        self.static_lats = None
+        self.static_lons = None
+        self.moving_projs = {}
         self.pressure = None
         self.bar_update = 1
         self.dis_clabel = dis_clabel
+        self.field_cache = cache.FieldCache(max_size=cache_size)
+        self.extraction = extraction
+        # Blocks of times are kept in field cache. So, a block can never be larger than the cache itself.
+        self.block_bytes = min(memory_budget * 1024 * 1024, self.field_cache.max_bytes)
+        self.disk_cache = None
+        if disk_cache_dir:
+            self.disk_cache = cache.DiskCache(disk_cache_dir, max_size=disk_cache_size)
+        self.file_id = None
+        # Floating point data is converted to float32 while reading in float32 mode. Otherwise data type is not changed.
+        self.dtype = np.dtype(np.float32) if precision == "float32" else None
 
     def get_domain_state(self):
+        """Find if the domain in input file is a moving nest"""
         if self.is_moving_domain is None:
-            self.is_moving_domain = wrf.is_moving_domain(self.input)
+            self.is_moving_domain = wrf.is_moving_domain(self.nc_fh)
+            # Each file may hold only a single time. So, compare first and last time across the files as well.
+            if not self.is_moving_domain and len(self.files) > 1:
+                last_time = len(self.files.times) - 1
+                self.is_moving_domain = not (
+                    np.allclose(
+                        to_np(self.read_field("lat", 0)),
+                        to_np(self.read_field("lat", last_time)),
+                    )
+                    and np.allclose(
+                        to_np(self.read_field("lon", 0)),
+                        to_np(self.read_field("lon", last_time)),
+                    )
+                )
+
+        return self.is_moving_domain
 
     def read_default_config(self, path=""):
-        config = ConfigParser()
-        config.read(os.path.join(utils.data_dir(), "wrf_variables.ini"))
-        wrf_defaults = {s: dict(config.items(s)) for s in config.sections()}
-        # print(wrf_defaults['u_cape']['title'])
-        return wrf_defaults
+        """Get registry of variables and their plotting defaults read from 'wrf_variables.ini'"""
+        if path:
+            return variables.read_registry(path)
+
+        return variables.get_registry()
 
     def read_file(self, input_path):
-        """Read input NetCDF file
+        """Read input NetCDF file(s)
+
+        This function reads the input file(s) provided and arranges times of all files in a single time index. Time
+        indices used throughout ``WrfPlot`` refer to this time index. Files are opened only when their data is needed.
+
+        Args:
+            input_path (str or list): Path to input netcdf file or list of paths to files
+        """
+
+        if isinstance(input_path, str):
+            input_path = [input_path]
+        self.files = fileio.WrfFileSet(input_path)
+        self.files.set_dtype(self.dtype)
+        self.nc_fh = self.files.dataset(self.files.index[0][0])
+        if self.disk_cache is not None:
+            self.file_id = cache.files_signature(
+                self.files.filepaths, self.files.attributes
+            )
+
+    def set_bbox(self, bbox):
+        """Restrict data to the sub-region of the domain covering a bounding box
+
+        Index window of the grid covering the bounding box is found once from coordinates of the first time. All data
+        is read from the window afterwards, so that diagnostics are computed only for the sub-region. Map extent
+        follows the coordinates of the window.
+
+        Args:
+            bbox (list): Bounding box as [lon0, lon1, lat0, lat1] in degrees
 
-        This function reads the input file provided and checks if it is a WRF model output
+        Returns:
+            tuple: (south_north start, stop, west_east start, stop) of the window or None if no grid point is inside
+        """
+        lats = to_np(self.read_field("lat", 0))
+        lons = to_np(self.read_field("lon", 0))
+        window = utils.bbox_to_window(lats, lons, bbox)
+        if window is None:
+            return None
+
+        self.files.set_window(window)
+        self.nc_fh = self.files.dataset(self.files.index[0][0])
+        self.field_cache.clear()
+        self.static_lats = self.static_lons = None
+
+        return window
+
+    def select_time(self, idx_time):
+        """Make the file containing a given time as ``self.nc_fh``
 
         Args:
-            input_path (str): Path to input netcdf file
+            idx_time (int): Time index
 
         Returns:
-            bool: True if successful, False otherwise.
+            int: Index of the time within ``self.nc_fh``
+        """
+        self.nc_fh, local_idx = self.files.locate(idx_time)
+
+        return local_idx
+
+    def read_field(self, name, idx_time, units=None):
+        """Read a raw or diagnostic field for a given time from the file containing it"""
+        kwargs = {"timeidx": self.select_time(idx_time)}
+        if units is not None:
+            kwargs["units"] = units
+
+        return self.compute_field(self.nc_fh, name, **kwargs)
+
+    def compute_field(self, nc_fh, name, **kwargs):
+        """Compute a field with ``wrf.getvar``
+
+        Diagnostics using horizontal derivatives (e.g. 'avo') need neighbouring grid points. When data is restricted
+        to a window, they are computed from the full grid and restricted to the window afterwards so that values at
+        the edges of the window are not affected.
         """
+        if (
+            isinstance(nc_fh, fileio.WindowedDataset)
+            and nc_fh.window is not None
+            and name in self.full_grid_diagnostics
+        ):
+            return self.to_precision(
+                nc_fh.window_field(getvar(nc_fh.dataset, name, **kwargs))
+            )
 
-        self.nc_fh = nc.Dataset(input_path, "r")
+        return getvar(nc_fh, name, **kwargs)
+
+    def to_precision(self, field):
+        """Convert floating point field to the data type of float32 mode. Field is returned as it is otherwise."""
+        if self.dtype is None or not np.issubdtype(field.dtype, np.floating):
+            return field
+
+        return field.astype(self.dtype, copy=False)
 
     def set_variable(self, variable):
         """Set the name of variable to the object"""
         self.var = variable
+        # Exported data needs neither projection of a map nor colour map
+        if self.export is not None:
+            return
         if self.proj is None:
             self.proj = self.set_proj()
 
         self.cmap = self.set_cmap(var_name=variable)
 
+    def get_field(self, name, idx_time, units=None):
+        """Get a raw or diagnostic field for a given time through the field cache
+
+        Diagnostics such as 'cape_2d' or 'cloudfrac' return several fields at once. Caching them against
+        (diagnostic, time index, units) lets every variable derived from the same diagnostic share one computation.
+
+        Args:
+            name (str): Name of the variable or diagnostic understood by ``wrf.getvar``
+            idx_time (int): Time index
+            units (str): Units of the field. Default units of wrf-python are used if None
+
+        Returns:
+            Field as returned by ``wrf.getvar``
+        """
+        if self.extraction == "bulk":
+            field = self.get_field_from_block(name, idx_time, units=units)
+            if field is not None:
+                return field
+
+        return self.field_cache.get_or_compute(
+            (name, idx_time, units), self.read_field, name, idx_time, units=units
+        )
+
+    def estimate_field_bytes(self, name):
+        """Estimate size of a field for one time in bytes
+
+        Size of raw variables is known from the file. Diagnostics are assumed to be as large as two 3D double
+        precision fields (e.g. 'uvmet' or 'cape_3d'), which is the largest output of diagnostics used by wrfplot.
+
+        Args:
+            name (str): Name of the variable or diagnostic understood by ``wrf.getvar``
+
+        Returns:
+            int: Size of the field in bytes
+        """
+        if name in self.nc_fh.variables:
+            variable = self.nc_fh.variables[name]
+            return int(np.prod(variable.shape[1:])) * variable.dtype.itemsize
+
+        dims = self.nc_fh.dimensions
+        return (
+            2
+            * len(dims["bottom_top"])
+            * len(dims["south_north"])
+            * len(dims["west_east"])
+            * (self.dtype or np.dtype(np.float64)).itemsize
+        )
+
+    def get_block(self, name, idx_time, units=None):
+        """Get a block of selected times of a field containing the given time
+
+        Number of times in a block is decided by the memory budget. Blocks never cross file boundaries. When all times
+        of the file are selected and fit in the budget, the field is extracted with a single
+        ``getvar(..., timeidx=ALL_TIMES)`` call. Otherwise, raw variables are read in chunks of selected times directly
+        from the file. ``wrf.getvar`` can compute diagnostics only for a single time or all times. Therefore, None is
+        returned for diagnostics in other cases so that they are extracted per time.
+
+        Args:
+            name (str): Name of the variable or diagnostic understood by ``wrf.getvar``
+            idx_time (int): Time index
+            units (str): Units of the field. Default units of wrf-python are used if None
+
+        Returns:
+            tuple: Row of each time index in the block and block itself, or None
+        """
+        file_no, local_idx = self.files.index[idx_time]
+        nc_fh = self.nc_fh = self.files.dataset(file_no)
+        n_times = len(nc_fh.dimensions["Time"])
+        file_times = [
+            _idx_time
+            for _idx_time in self.get_selected_times()
+            if self.files.index[_idx_time][0] == file_no
+        ]
+        block_times = int(self.block_bytes // max(1, self.estimate_field_bytes(name)))
+        if len(file_times) < 2 or block_times < 2 or idx_time not in file_times:
+            return None
+
+        if len(file_times) == n_times and block_times >= n_times:
+            kwargs = {"timeidx": ALL_TIMES}
+            if units is not None:
+                kwargs["units"] = units
+            block = self.field_cache.get_or_compute(
+                (name, (file_no, ALL_TIMES), units),
+                self.compute_field,
+                nc_fh,
+                name,
+                **kwargs,
+            )
+            rows = {_idx_time: self.files.index[_idx_time][1] for _idx_time in file_times}
+            return rows, block
+        elif name in nc_fh.variables and units is None:
+            start = (file_times.index(idx_time) // block_times) * block_times
+            chunk = file_times[start : start + block_times]
+            chunk_local = [self.files.index[_idx_time][1] for _idx_time in chunk]
+            block = self.field_cache.get_or_compute(
+                (name, (file_no, tuple(chunk_local)), units),
+                lambda: np.asarray(nc_fh.variables[name][chunk_local]),
+            )
+            return {_idx_time: row for row, _idx_time in enumerate(chunk)}, block
+
+        return None
+
+    def get_field_from_block(self, name, idx_time, units=None):
+        """Get a field for a given time from the block of times containing it
+
+        Args:
+            name (str): Name of the variable or diagnostic understood by ``wrf.getvar``
+            idx_time (int): Time index
+            units (str): Units of the field. Default units of wrf-python are used if None
+
+        Returns:
+            Field for the given time or None if the field can not be extracted in blocks
+        """
+        block = self.get_block(name, idx_time, units=units)
+        if block is None:
+            return None
+
+        rows, data = block
+        # Diagnostics with multiple outputs (e.g. 'uvmet') keep their component dimension ahead of Time
+        if "Time" in getattr(data, "dims", ()):
+            return data.isel(Time=rows[idx_time])
+
+        return data[rows[idx_time]]
+
     def to_datetime(self, dates):
         """Convert numpy datetime data into string time
         Args:
@@ -134,22 +417,67 @@ class WrfPlot:
         return datetime.fromtimestamp(timestamp)
 
     def get_time_period(self):
-        """Extract times of the WRF output file"""
-        dates = getvar(self.nc_fh, "Times", timeidx=ALL_TIMES)
+        """Extract times of the WRF output file(s)
+
+        Times are formatted only once for the input file(s) and reused afterwards.
+        """
+        if len(self.date_time) == len(self.files.times):
+            return self.date_time
+
         self.date_time = []
-        for _date in dates:
-            if not np.isnat(_date):
-                self.date_time.append(
-                    np.datetime64(_date.values, "m")
-                    .astype(datetime)
-                    .strftime("%d-%m-%Y_%H:%M")
-                )
+        for _date in self.files.times:
+            self.date_time.append(
+                np.datetime64(_date, "m").astype(datetime).strftime("%d-%m-%Y_%H:%M")
+            )
 
         if len(self.date_time) > 0:
             self.cycle = self.date_time[0]
 
         return self.date_time
 
+    def select_times(self, hours=None, valid=None):
+        """Select times to be plotted
+
+        Times are selected by forecast hours from the first time and/or by valid times. Only selected times are
+        extracted and plotted.
+
+        Args:
+            hours (list): List of (start, stop, step) forecast hour ranges. Stop is inclusive.
+            valid (list): List of valid times as numpy datetime64
+
+        Returns:
+            list: Selected time indices in increasing order
+        """
+        if hours is None and valid is None:
+            self.time_indices = None
+            return self.get_selected_times()
+
+        times = [np.datetime64(_time, "m") for _time in self.files.times]
+        selected = set()
+        for idx_time, _time in enumerate(times):
+            fcst_hour = int(round((_time - times[0]) / np.timedelta64(1, "h")))
+            for start, stop, step in hours or []:
+                if start <= fcst_hour <= stop and (fcst_hour - start) % step == 0:
+                    selected.add(idx_time)
+        for _valid in valid or []:
+            _valid = np.datetime64(_valid, "m")
+            if _valid in times:
+                selected.add(times.index(_valid))
+            else:
+                tqdm.write(
+                    f"Valid time {utils.quote(_valid)} is not available in input file(s). Skipping..."
+                )
+        self.time_indices = sorted(selected)
+
+        return self.time_indices
+
+    def get_selected_times(self):
+        """Time indices to be plotted. All times are plotted unless selected with ``select_times``."""
+        if self.time_indices is None:
+            return list(range(len(self.files.times)))
+
+        return self.time_indices
+
     def extract_data(self, var_name, u=None, v=None, idx_time=None, level=None):
         """Extract data for a given variable
 
@@ -168,41 +496,18 @@ class WrfPlot:
         cape_3d = ["u_cape", "u_cin"]
 
         if var_name == "winds":
-            u, v = getvar(self.nc_fh, "uvmet10", timeidx=idx_time, units="kt")
-            var_data = getvar(self.nc_fh, "wspd_wdir10", timeidx=idx_time, units="kt")[
-                0
-            ]
+            u, v = self.get_field("uvmet10", idx_time, units="kt")
+            var_data = self.get_field("wspd_wdir10", idx_time, units="kt")[0]
         elif var_name in cape_2d:
-            var_data = getvar(self.nc_fh, "cape_2d", timeidx=idx_time)[
-                cape_2d.index(var_name)
-            ]
+            var_data = self.get_field("cape_2d", idx_time)[cape_2d.index(var_name)]
         elif var_name in cloudfrac:
-            var_data = getvar(self.nc_fh, "cloudfrac", timeidx=idx_time)[
-                cloudfrac.index(var_name)
-            ]
+            var_data = self.get_field("cloudfrac", idx_time)[cloudfrac.index(var_name)]
         elif var_name in ["ppn", "ppn_conv"]:
-            if var_name == "ppn_conv":
-                rain_c_current = getvar(self.nc_fh, "RAINC", timeidx=idx_time)
-            else:
-                rain_c_current = getvar(self.nc_fh, "RAINC", timeidx=idx_time)
-                rain_nc_current = getvar(self.nc_fh, "RAINNC", timeidx=idx_time)
-            if var_name == "ppn_conv" and idx_time == 0:
-                var_data = rain_c_current
-            elif var_name == "ppn" and idx_time == 0:
-                var_data = rain_c_current + rain_nc_current
-            if var_name == "ppn_conv" and idx_time != 0:
-                rain_c_previous = getvar(self.nc_fh, "RAINC", timeidx=(idx_time - 1))
-                var_data = rain_c_current - rain_c_previous
-            elif var_name == "ppn" and idx_time != 0:
-                rain_c_previous = getvar(self.nc_fh, "RAINC", timeidx=(idx_time - 1))
-                rain_nc_previous = getvar(self.nc_fh, "RAINNC", timeidx=(idx_time - 1))
-                var_data = (rain_c_current + rain_nc_current) - (
-                    rain_nc_previous + rain_c_previous
-                )
+            rows, tendency = self.get_precip_tendency(var_name, idx_time)
+            var_data = tendency[rows[idx_time]]
         elif var_name == "ppn_accum":
-            var_data = getvar(self.nc_fh, "RAINC", timeidx=idx_time) + getvar(
-                self.nc_fh, "RAINNC", timeidx=idx_time
-            )
+            rows, accumulated = self.get_accumulated_precip(var_name, idx_time)
+            var_data = accumulated[rows[idx_time]]
         elif var_name in ["inv1", "inv2", "inv3"]:
             var_data = self.interpolate_to(
                 var_name=var_name, u_data=u, v_data=v, idx_time=idx_time, p_level=level
@@ -212,39 +517,284 @@ class WrfPlot:
                 var_name=var_name, u_data=u, v_data=v, idx_time=idx_time, p_level=level
             )
         else:
-            var_data = getvar(self.nc_fh, var_name, timeidx=idx_time)
+            var_data = self.get_field(var_name, idx_time)
+
+        return self.convert_unit(var_data, var_name), u, v
+
+    def required_fields(self, var_name):
+        """Raw variables and diagnostics read through ``get_field`` for a time of a variable
+
+        It has to be kept in line with ``extract_data`` and ``interpolate_to``. Precipitation is read for all times at
+        once and is not listed.
+
+        Args:
+            var_name (str): Name of the variable supported by the application
+
+        Returns:
+            list: (name, units) of each field
+        """
+        cape_2d = ["mcape", "mcin", "lcl", "lfc"]
+        cloudfrac = ["low_cloudfrac", "mid_cloudfrac", "high_cloudfrac"]
+        if var_name == "winds":
+            return [("uvmet10", "kt"), ("wspd_wdir10", "kt")]
+        elif var_name in cape_2d:
+            return [("cape_2d", None)]
+        elif var_name in cloudfrac:
+            return [("cloudfrac", None)]
+        elif var_name in ["ppn", "ppn_conv", "ppn_accum"]:
+            return []
+        elif var_name in ["inv1", "inv2"]:
+            return [("pressure", None), ("temp", "degC")]
+        elif var_name in ["u_cape", "u_cin"]:
+            return [("pressure", None), ("cape_3d", None)]
+        elif var_name in ["u_winds", "u_stream"]:
+            return [("pressure", None), ("uvmet", "kt"), ("wspd_wdir", "kt")]
+        elif var_name == "u_winds_temp":
+            return [("pressure", None), ("uvmet", "kt"), ("temp", "degC")]
+        elif "u_" in var_name or var_name == "inv3":
+            return [("pressure", None), (var_name.replace("u_", ""), None)]
+
+        return [(var_name, None)]
+
+    def get_precip_block(self, var_name, idx_time):
+        """Get the block of selected times of precipitation containing the given time
+
+        Precipitation is read in blocks of selected times so that a long run on a large domain is never held whole.
+        Number of times in a block is decided by the memory budget, counting the previous time of each time.
+
+        Args:
+            var_name (str): Name of the precipitation variable i.e., 'ppn', 'ppn_conv' or 'ppn_accum'
+            idx_time (int): Time index
+
+        Returns:
+            tuple: Selected time indices of the block
+        """
+        names = ["RAINC"] if var_name == "ppn_conv" else ["RAINC", "RAINNC"]
+        time_bytes = sum(self.estimate_field_bytes(name) for name in names)
+        block_times = max(1, int(self.block_bytes // max(1, 2 * time_bytes)))
+        selected = self.get_selected_times()
+        start = (selected.index(idx_time) // block_times) * block_times
+
+        return tuple(selected[start : start + block_times])
+
+    def get_accumulated_precip(self, var_name, idx_time):
+        """Get accumulated precipitation for a block of selected times and the times previous to them
+
+        Convective (RAINC) and, except for 'ppn_conv', non-convective (RAINNC) precipitation is read in a single read
+        for each file. When bucket option (BUCKET_MM) is used in WRF model, bucket counters I_RAINC & I_RAINNC are
+        added back so that accumulation keeps increasing even after bucket is reset.
+
+        Args:
+            var_name (str): Name of the precipitation variable i.e., 'ppn', 'ppn_conv' or 'ppn_accum'
+            idx_time (int): Time index
+
+        Returns:
+            tuple: Row of each time index in data and accumulated precipitation in mm with time as leading dimension
+        """
+        key = self.precip_cache_key(var_name, idx_time, accumulated=True)
+
+        return self.field_cache.get_or_compute(
+            key, self.read_accumulated_precip, key[0].split("+"), list(key[1])
+        )
+
+    def read_accumulated_precip(self, names, idx_times):
+        """Read and add accumulated precipitation variables for given times including bucket counters
+
+        Each file is read once for all of its times in ``idx_times``.
+
+        Returns:
+            tuple: Row of each time index in data and accumulated precipitation
+        """
+        accumulated = []
+        for file_no in range(len(self.files)):
+            file_idx_times = [
+                idx_time
+                for idx_time in idx_times
+                if self.files.index[idx_time][0] == file_no
+            ]
+            if len(file_idx_times) == 0:
+                continue
+            nc_fh = self.nc_fh = self.files.dataset(file_no)
+            local_idx = [self.files.index[idx_time][1] for idx_time in file_idx_times]
+            bucket_mm = float(getattr(nc_fh, "BUCKET_MM", -1.0))
+            total = None
+            for name in names:
+                rain = np.ma.getdata(nc_fh.variables[name][local_idx])
+                bucket_name = "I_" + name
+                if bucket_mm > 0 and bucket_name in nc_fh.variables:
+                    rain = rain + bucket_mm * np.ma.getdata(
+                        nc_fh.variables[bucket_name][local_idx]
+                    )
+                total = rain if total is None else total + rain
+            accumulated.append((file_idx_times, self.to_precision(total)))
+        accumulated.sort(key=lambda x: x[0][0])
+
+        rows = {}
+        for file_idx_times, _ in accumulated:
+            for idx_time in file_idx_times:
+                rows[idx_time] = len(rows)
+
+        return rows, np.concatenate([total for _, total in accumulated], axis=0)
+
+    def get_precip_tendency(self, var_name, idx_time):
+        """Get precipitation between consecutive times for the block of selected times containing a time
+
+        Precipitation for a time is the difference of accumulated precipitation from the previous time. First time
+        gets the accumulated precipitation itself.
+
+        Args:
+            var_name (str): Name of the precipitation variable i.e., 'ppn' or 'ppn_conv'
+            idx_time (int): Time index
+
+        Returns:
+            tuple: Row of each selected time index in data and precipitation in mm with time as leading dimension
+        """
+        block = self.get_precip_block(var_name, idx_time)
+
+        def tendency():
+            rows, accumulated = self.get_accumulated_precip(var_name, idx_time)
+            current = [rows[_idx_time] for _idx_time in block]
+            previous = [rows[max(_idx_time - 1, 0)] for _idx_time in block]
+            _tendency = accumulated[current] - accumulated[previous]
+            # First time of the run has no previous time. Accumulation itself is the precipitation.
+            for row, _idx_time in enumerate(block):
+                if _idx_time == 0:
+                    _tendency[row] = accumulated[current[row]]
+            return {_idx_time: row for row, _idx_time in enumerate(block)}, _tendency
+
+        return self.field_cache.get_or_compute(self.precip_cache_key(var_name, idx_time), tendency)
+
+    def precip_cache_key(self, var_name, idx_time, accumulated=False):
+        """Key of the block of precipitation containing a time in field cache
+
+        Args:
+            var_name (str): Name of the precipitation variable i.e., 'ppn', 'ppn_conv' or 'ppn_accum'
+            idx_time (int): Time index
+            accumulated (bool): Key of accumulated precipitation even if tendency is plotted for the variable
+
+        Returns:
+            tuple: Key of the block plotted for the variable i.e., accumulation for 'ppn_accum' or else tendency
+        """
+        block = self.get_precip_block(var_name, idx_time)
+        if accumulated or var_name == "ppn_accum":
+            names = ["RAINC"] if var_name == "ppn_conv" else ["RAINC", "RAINNC"]
+            idx_times = sorted(set(block) | set(i - 1 for i in block if i > 0))
+            return "+".join(names), tuple(idx_times), "mm"
+
+        return var_name, block, "mm"
+
+    def disk_cache_key(self, var_name, idx_time, level=None):
+        """Key of extracted data in disk cache"""
+        return (
+            self.file_id,
+            var_name,
+            None if level is None else float(level),
+            idx_time,
+            self.files.window,
+            None if self.dtype is None else self.dtype.name,
+        )
+
+    def extract_fields(self, var_name, idx_time, level=None):
+        """Extract data for a given variable, time and level through the disk cache when it is enabled
+
+        Returns:
+            Data, U component (default is None) and V component (default is None)
+        """
+        if self.disk_cache is None:
+            return self.extract_data(var_name, idx_time=idx_time, level=level)
 
-        return self.convert_unit(var_data), u, v
+        key = self.disk_cache_key(var_name, idx_time, level)
+        fields = self.disk_cache.load(key)
+        if fields is None:
+            fields = self.extract_data(var_name, idx_time=idx_time, level=level)
+            self.disk_cache.save(key, fields)
+
+        return fields
+
+    def extract_levels(self, var_name, idx_time, levels):
+        """Extract data of an upper air variable for all given levels of a time
+
+        Pressure and the 3D field are read only once for a time and interpolated to every level from it. Levels are
+        loaded from disk cache when all of them are available in it.
+
+        Args:
+            var_name (str): Name of the upper air variable supported by the application
+            idx_time (int): Time index
+            levels (list): Pressure levels in hPa
+
+        Returns:
+            list: Data, U component and V component for each level in the order of ``levels``
+        """
+        if self.disk_cache is None:
+            return self.interpolate_levels(var_name, idx_time, levels)
+
+        keys = [self.disk_cache_key(var_name, idx_time, level) for level in levels]
+        fields = [self.disk_cache.load(key) for key in keys]
+        if any(level_fields is None for level_fields in fields):
+            fields = self.interpolate_levels(var_name, idx_time, levels)
+            for key, level_fields in zip(keys, fields):
+                self.disk_cache.save(key, level_fields)
+
+        return fields
+
+    def interpolate_levels(self, var_name, idx_time, levels):
+        """Interpolate an upper air variable to all given levels of a time
+
+        Returns:
+            list: Data, U component and V component for each level in the order of ``levels``
+        """
+        # interplevel drops level dimension when only one level is requested
+        if len(levels) == 1:
+            var_data, u_data, v_data = self.interpolate_to(
+                var_name=var_name, idx_time=idx_time, p_level=levels[0]
+            )
+            return [(self.convert_unit(var_data, var_name), u_data, v_data)]
+
+        var_data, u_data, v_data = self.interpolate_to(
+            var_name=var_name, idx_time=idx_time, p_level=list(levels)
+        )
+        fields = []
+        for index in range(len(levels)):
+            fields.append(
+                (
+                    self.convert_unit(var_data[index], var_name),
+                    None if u_data is None else u_data[index],
+                    None if v_data is None else v_data[index],
+                )
+            )
+
+        return fields
 
     def interpolate_to(
         self, var_name, u_data=None, v_data=None, idx_time=None, p_level=None
     ):
         """Interpolate data to specific pressure height
 
-        Receive data and interpolate to specific height level
+        Receive data and interpolate to specific height level. When list of levels is provided, all levels are
+        interpolated in one go and returned data will have levels as the leading dimension.
 
         Args:
             var_name (str): Name of the variable supported by the application
             u_data (numpy array): U component wind
             v_data (numpy array): V component wind
+            idx_time (int): Time index
+            p_level (float or list): Pressure level(s) in hPa
 
         Returns:
             Data, U component (default is None) and V component (default is None) in numpy array format
         """
-        pressure = getvar(self.nc_fh, "pressure", timeidx=idx_time)
+        pressure = self.get_field("pressure", idx_time)
         cape_3d = ["u_cape", "u_cin"]
         if var_name in cape_3d:
-            var_data = getvar(self.nc_fh, "cape_3d", timeidx=idx_time)[
-                cape_3d.index(var_name)
-            ]
+            var_data = self.get_field("cape_3d", idx_time)[cape_3d.index(var_name)]
         elif var_name in ["u_winds", "u_stream"]:
-            u, v = getvar(self.nc_fh, "uvmet", timeidx=idx_time, units="kt")
+            u, v = self.get_field("uvmet", idx_time, units="kt")
             u_data = interplevel(u, pressure, p_level)
             v_data = interplevel(v, pressure, p_level)
-            var_data = getvar(self.nc_fh, "wspd_wdir", timeidx=idx_time, units="kt")[0]
+            var_data = self.get_field("wspd_wdir", idx_time, units="kt")[0]
             # var_data_interp = interplevel(var_data, pressure, p_level)
         elif var_name in ["inv1", "inv2"]:
-            u_temp = getvar(self.nc_fh, "temp", timeidx=idx_time, units="degC")
+            u_temp = self.get_field("temp", idx_time, units="degC")
             if var_name == "inv1":
                 t_low_hpa = interplevel(u_temp, pressure, 975)
                 t_high_hpa = interplevel(u_temp, pressure, 950)
@@ -254,12 +804,12 @@ class WrfPlot:
             var_data_interp = t_high_hpa - t_low_hpa
             return var_data_interp, u_data, v_data
         elif var_name == "u_winds_temp":
-            u, v = getvar(self.nc_fh, "uvmet", timeidx=idx_time, units="kt")
+            u, v = self.get_field("uvmet", idx_time, units="kt")
             u_data = interplevel(u, pressure, p_level)
             v_data = interplevel(v, pressure, p_level)
-            var_data = getvar(self.nc_fh, "temp", timeidx=idx_time, units="degC")
+            var_data = self.get_field("temp", idx_time, units="degC")
         else:
-            var_data = getvar(self.nc_fh, var_name.replace("u_", ""), timeidx=idx_time)
+            var_data = self.get_field(var_name.replace("u_", ""), idx_time)
 
         var_data_interp = interplevel(var_data, pressure, p_level)
 
@@ -275,100 +825,244 @@ class WrfPlot:
         if self.var is None:
             self.set_variable(variable=var_name)
         if self.ulevels is None:
-            self.ulevels = [925, 850, 700, 600, 500, 400, 300, 200]
-        if "u_" not in self.var:
-            img_paths = []
-            with tqdm(
-                total=(self.total_vars * len(self.get_time_period())),
-                desc="Completed",
-                leave=False,
-                position=0,
-                colour="green",
-            ) as pbar:
-                for index, _date_time in enumerate(self.get_time_period()):
-                    tqdm.write(
-                        f"\tPlotting {utils.quote(var_name)} for Time : {utils.quote(_date_time)} UTC"
-                    )
-                    img_path = self.make_map(
-                        var_name=var_name, idx_time=index, time_fcst=_date_time
-                    )
-                    self.bar_update = self.bar_update + 1
-                    pbar.update(self.bar_update - pbar.n)
-                    if img_path is not None:
-                        img_paths.append(img_path)
-
-                if self.animation is not False:
-                    self.make_animation(var_name=var_name, img_paths=img_paths)
-                self.reset_axes()
-
-        elif "u_" in self.var:
-            img_paths_p_level = []
-            with tqdm(
-                total=len(self.total_vars * self.ulevels * len(self.get_time_period())),
-                desc="Completed",
-                leave=False,
-                position=0,
-                colour="green",
-            ) as pb_level:
-                for ulevel in self.ulevels:
-                    for index, time_fcst in enumerate(self.date_time):
-                        tqdm.write(
-                            f"\tPlotting {utils.quote(var_name)} for level {utils.quote(ulevel)} hPa and Time :"
-                            f" {utils.quote(time_fcst)} UTC"
-                        )
-                        img_path = self.make_map(
-                            var_name=var_name,
-                            idx_time=index,
-                            time_fcst=time_fcst,
-                            p_level=ulevel,
-                        )
-                        self.bar_update = self.bar_update + 1
-                        pb_level.update(self.bar_update - pb_level.n)
-                        if img_path is not None:
-                            img_paths_p_level.append(img_path)
-                        # pb_level.update()
-
-                    if self.animation is not False:
-                        self.make_animation(
-                            var_name=var_name, img_paths=img_paths_p_level
-                        )
-
-                self.reset_axes()
+            self.ulevels = self.default_ulevels
+        img_paths = []
+        frames = len(self.ulevels) if "u_" in self.var else 1
+        with tqdm(
+            total=(self.total_vars * frames * len(self.get_selected_times())),
+            desc="Completed",
+            leave=False,
+            position=0,
+            colour="green",
+        ) as pbar:
+            # Upper air variables are plotted at all levels of a time before the next time so that pressure and 3D
+            # field are computed once for all levels of a time
+            for index in self.get_selected_times():
+                img_paths.extend(self.plot_time(var_name=var_name, idx_time=index))
+                self.bar_update = self.bar_update + frames
+                pbar.update(self.bar_update - pbar.n)
+
+            if self.animation is not False:
+                self.make_animation(var_name=var_name, img_paths=img_paths)
+            self.reset_axes()
+
+    def plot_time(self, var_name, idx_time, fields=None):
+        """Plot a variable for a time. Upper air variables are plotted at all levels of ``self.ulevels``.
+
+        Args:
+            var_name (str): Name of the variable
+            idx_time (int): Index of time in the unified time index
+            fields (list): Already extracted fields of each level of an upper air variable, if any
+
+        Returns:
+            list: Paths to saved images
+        """
+        img_paths = []
+        time_fcst = self.get_time_period()[idx_time]
+        action = "Plotting" if self.export is None else "Exporting"
+        if "u_" not in var_name:
+            tqdm.write(
+                f"\t{action} {utils.quote(var_name)} for Time : {utils.quote(time_fcst)} UTC"
+            )
+            img_path = self.make_map(
+                var_name=var_name, idx_time=idx_time, time_fcst=time_fcst
+            )
+            if img_path is not None:
+                img_paths.append(img_path)
+
+            return img_paths
+
+        if fields is None:
+            fields = self.extract_levels(
+                var_name=var_name, idx_time=idx_time, levels=self.ulevels
+            )
+        for ulevel, level_fields in zip(self.ulevels, fields):
+            tqdm.write(
+                f"\t{action} {utils.quote(var_name)} for level {utils.quote(ulevel)} hPa and Time :"
+                f" {utils.quote(time_fcst)} UTC"
+            )
+            img_path = self.make_map(
+                var_name=var_name,
+                idx_time=idx_time,
+                time_fcst=time_fcst,
+                p_level=ulevel,
+                fields=level_fields,
+            )
+            if img_path is not None:
+                img_paths.append(img_path)
+
+        return img_paths
+
+    def prepare_variable(self, var_name, cmap=False, clevels=False):
+        """Make the object ready to plot times of a variable in any order
+
+        Used by worker processes which get times of variables in no particular order. Colour map and contour levels
+        are set the same way as plotting variables one after another i.e., ``cmap`` and ``clevels`` are to be given
+        for the first variable only.
+        """
+        self.reset_axes()
+        self.cmap = cmap
+        self.clevels = clevels
+        self.set_variable(var_name)
+        if self.ulevels is None:
+            self.ulevels = self.default_ulevels
+        # Exported data needs neither a figure nor contour levels
+        if self.export is None:
+            self.plot.create_fig(self.proj)
+            self.fix_clevels(var_name)
+
+    def activate_variable(self, var_name, first=False):
+        """Make a variable current so that times of several variables can be plotted in any order
+
+        Each variable is plotted on its own map with its own colour map and contour levels. They are prepared when the
+        variable is activated for the first time and restored afterwards.
+
+        Args:
+            var_name (str): Name of the variable
+            first (bool): True for the first variable requested, to which colour map and contour levels given by
+                user apply
+        """
+        if self.var == var_name and var_name in self.variable_states:
+            return
+        if self.var in self.variable_states:
+            self.variable_states[self.var] = (self.plot, self.cmap, self.clevels)
+        if var_name in self.variable_states:
+            self.plot, self.cmap, self.clevels = self.variable_states[var_name]
+            self.var = var_name
+            return
+
+        self.plot = self.new_plot() if self.export is None else None
+        cmap, clevels = self.user_options if first else (False, False)
+        self.prepare_variable(var_name, cmap=cmap, clevels=clevels)
+        self.variable_states[var_name] = (self.plot, self.cmap, self.clevels)
+
+    def deactivate_variable(self, var_name):
+        """Close map of a variable and forget its state once all of its times are plotted
+
+        Args:
+            var_name (str): Name of the variable
+        """
+        state = self.variable_states.pop(var_name, None)
+        if state is None:
+            return
+        if self.var == var_name:
+            self.reset_axes()
+            self.plot = None
+        elif state[0] is not None:
+            state[0].close_fig()
+
+    def new_plot(self):
+        """Create map to plot a variable on
+
+        Modules for plotting maps are imported only when a map is needed, so that exporting data does not import them.
+        """
+        import plot
+
+        return plot.PlotMap(**self.plot_options)
+
+    def fix_clevels(self, var_name):
+        """Find contour levels requested as number of levels from the first selected time
+
+        Levels found for the first plotted time are kept for the rest of the times. Finding them before plotting gives
+        same levels irrespective of the order in which times are plotted.
+        """
+        if (
+            isinstance(self.clevels, bool)
+            or not isinstance(self.clevels, int)
+            or var_name == "slp"
+            or self.config[var_name].clevels == "auto"
+        ):
+            return self.clevels
+        idx_time = self.get_selected_times()[0]
+        if "u_" in var_name:
+            data = self.extract_levels(var_name, idx_time, self.ulevels[:1])[0][0]
+        else:
+            data = self.extract_fields(var_name, idx_time=idx_time)[0]
+
+        return self.set_clevels(var_name=var_name, var_data=data)
 
     def reset_axes(self):
         """Reset figure axes to make it ready for next iteration of plots"""
         self.cmap = False
         self.clevels = False
-        self.plot.cbar = False
-        self.plot.c_bar_extend = None
+        if self.plot is not None:
+            self.plot.close_fig()
+            self.plot.c_bar_extend = None
 
     def make_animation(self, var_name, img_paths):
-        """Make animation for given image paths"""
+        """Make animation for given image paths
+
+        Animations are GIF for PNG and JPEG images and of same format as the images for WebP and AVIF.
+        """
+        import animation
+
+        anim_format = encoder.ANIMATION_FORMATS[self.fig_format]
         if len(img_paths) > 0:
             output_gif_name = (
                 os.path.join(
                     os.path.dirname(img_paths[0]),
                     var_name + "-" + self.date_time[0].replace(":", "_"),
                 )
-                + ".gif"
+                + "."
+                + anim_format
+            )
+            frames = {
+                path: self.frames.pop(path) for path in img_paths if path in self.frames
+            }
+            self.frames_nbytes = self.frames_nbytes - sum(encoder.image_nbytes(image) for image in frames.values())
+            animation.make_animation(
+                img_paths,
+                output_gif_name,
+                speed=self.speed,
+                file_type=encoder.EXTENSIONS[self.fig_format],
+                frames=frames,
+                anim_format=anim_format,
+                quality=self.quality,
             )
-            animation.make_animation(img_paths, output_gif_name, speed=self.speed)
         else:
             tqdm.write(
-                f"\nNot enough images available to make GIF image for variable {utils.quote(var_name)}...\n"
+                f"\nNot enough images available to make {anim_format.upper()} image for variable "
+                f"{utils.quote(var_name)}...\n"
             )
 
-    def make_map(self, var_name, idx_time=None, time_fcst=None, p_level=None):
-        """Make a map for a given variable"""
-        data, u_data, v_data = self.extract_data(
-            var_name, idx_time=idx_time, level=p_level
-        )
+    def keep_frame(self, img_path, image):
+        """Keep pixels of a saved map for its animation unless they go beyond ``frame_budget``
+
+        Args:
+            img_path (str): Path to the saved map
+            image (Image): Pixels of the map as saved
+        """
+        nbytes = encoder.image_nbytes(image)
+        if self.frames_nbytes + nbytes <= self.frame_budget:
+            self.frames[img_path] = image
+            self.frames_nbytes = self.frames_nbytes + nbytes
+
+    def make_map(
+        self, var_name, idx_time=None, time_fcst=None, p_level=None, fields=None
+    ):
+        """Make a map for a given variable
+
+        Data is extracted for the given time and level unless already extracted ``fields`` i.e., (data, U component,
+        V component) are provided.
+        """
+        if fields is None:
+            fields = self.extract_fields(var_name, idx_time=idx_time, level=p_level)
+        data, u_data, v_data = fields
+        if self.export is not None:
+            lats, lons = self.extract_lats_lons(
+                var_name=var_name, var_data=data, idx_time=idx_time
+            )
+            return self.get_exporter().write(
+                var_name, idx_time, time_fcst, data, lats, lons, level=p_level
+            )
+        if self.get_domain_state():
+            self.plot.set_projection(self.get_proj(idx_time))
         # lats, lons = latlon_coords(data)
         lats, lons = self.extract_lats_lons(
             var_name=var_name, var_data=data, idx_time=idx_time
         )
         # clevels = self.set_clevels(var_name=var_name, var_data=data)
-        if self.config[var_name]["clevels"] == "auto":
+        if self.config[var_name].clevels == "auto":
             clevels = utils.get_auto_clevel(data=data)
         else:
             clevels = self.set_clevels(var_name=var_name, var_data=data)
@@ -411,37 +1105,80 @@ class WrfPlot:
                 fcst_time=time_fcst,
                 level=p_level,
             )
+        if img_path is not None and self.keep_frames:
+            self.keep_frame(img_path, self.plot.image)
 
         return img_path
 
+    def get_exporter(self):
+        """Get exporter writing fields in native projection of the domain, created on first use"""
+        if self.exporter is None:
+            proj4 = getvar(self.nc_fh, "T2", timeidx=0).attrs["projection"].proj4()
+            times = {
+                idx_time: self.files.times[idx_time]
+                for idx_time in self.get_selected_times()
+            }
+            self.exporter = export.DataExport(
+                self.export,
+                self.output,
+                proj4,
+                times,
+                levels=self.ulevels or self.default_ulevels,
+                moving=self.get_domain_state(),
+                config=self.config,
+            )
+
+        return self.exporter
+
+    def close_export(self):
+        """Close files of exported data, if any"""
+        if self.exporter is not None:
+            self.exporter.close()
+
     def set_cmap(self, var_name):
         """Get cmap from variable.ini file"""
         if self.cmap is False:
-            cmap_name = self.config[var_name]["cmap"]
+            cmap_name = self.config[var_name].cmap
         else:
             cmap_name = self.cmap
 
         return utils.get_cmap(cmap_name)
 
     def extract_lats_lons(self, var_name, var_data, idx_time):
-        """Extract lat & lon data and update ``self.lats`` and ``self.lons`` variables accordingly"""
-        self.lats = getvar(self.nc_fh, "lat", timeidx=idx_time)
-        self.lons = getvar(self.nc_fh, "lon", timeidx=idx_time)
-        """if self.lats is None and self.lons is None:
-            if var_name in ['inv1', 'inv2', 'inv3']:
-                var_data = getvar(self.nc_fh, 'slp', timeidx=idx_time)
-            lats, lons = latlon_coords(var_data)
-            # print(lons.values)
-            if lats.ndim == 3:
-                self.lats = lats[0]
-                self.lons = lons[0]
-            else:
+        """Extract lat & lon data and update ``self.lats`` and ``self.lons`` variables accordingly
 
-                self.lats = lats[0]
-                self.lons = lons[0]"""
+        Coordinates of a static domain are same for all times. Therefore, they are read only once and reused for every
+        variable, level and time. Only moving nests are read for each time.
+        """
+        self.get_domain_state()
+        if self.is_moving_domain:
+            self.lats = self.get_field("lat", idx_time)
+            self.lons = self.get_field("lon", idx_time)
+        elif self.static_lats is None or self.static_lons is None:
+            self.static_lats = getvar(self.nc_fh, "lat", timeidx=0)
+            self.static_lons = getvar(self.nc_fh, "lon", timeidx=0)
+            self.lats, self.lons = self.static_lats, self.static_lons
+        else:
+            self.lats, self.lons = self.static_lats, self.static_lons
 
         return self.lats, self.lons
 
+    def get_proj(self, idx_time):
+        """Get projection for a given time
+
+        Projection of a static domain is computed once. Moving nests get a projection for each time.
+        """
+        self.get_domain_state()
+        if not self.is_moving_domain:
+            return self.proj
+        if idx_time not in self.moving_projs:
+            local_idx = self.select_time(idx_time)
+            self.moving_projs[idx_time] = get_cartopy(
+                wrfin=self.nc_fh, timeidx=local_idx
+            )
+
+        return self.moving_projs[idx_time]
+
     def set_proj(self):
         """Get projection details from data extracted"""
         data = getvar(self.nc_fh, "T2")
@@ -461,9 +1198,9 @@ class WrfPlot:
         else:
             if level is None:
                 return (
-                    self.config[var_name]["title"]
+                    self.config[var_name].title
                     + " ("
-                    + self.config[var_name]["unit"]
+                    + self.config[var_name].unit
                     + ")\n"
                     "Cycle : "
                     + self.cycle
@@ -473,9 +1210,9 @@ class WrfPlot:
                 )
             else:
                 return (
-                    self.config[var_name]["title"]
+                    self.config[var_name].title
                     + " ("
-                    + self.config[var_name]["unit"]
+                    + self.config[var_name].unit
                     + ") at "
                     + str(int(level))
                     + " hPa\nCycle : "
@@ -487,20 +1224,22 @@ class WrfPlot:
 
     def set_clevels(self, var_name, var_data):
         """Create automatic contour levels for specific variable"""
-        if self.var == "slp":
+        if var_name == "slp":
             self.clevels = utils.get_auto_clevel(var_data, slp=True)
         else:
             self.clevels = utils.get_clevels(
-                var_name=var_name, clevels=self.clevels, data=var_data
+                self.config[var_name], clevels=self.clevels, data=var_data
             )
 
         return self.clevels
 
-    def convert_unit(self, data):
-        """Convert data to another unit"""
-        if self.var in ["T2", "u_temp", "u_theta", "u_tv", "u_twb", "u_temp"]:
+    def convert_unit(self, data, var_name=None):
+        """Convert data of a variable (default is ``self.var``) to another unit"""
+        if var_name is None:
+            var_name = self.var
+        if var_name in ["T2", "u_temp", "u_theta", "u_tv", "u_twb", "u_temp"]:
             return convert.k_to_c(data)
-        elif self.var in ["low_cloudfrac", "mid_cloudfrac", "high_cloudfrac"]:
+        elif var_name in ["low_cloudfrac", "mid_cloudfrac", "high_cloudfrac"]:
             return np.round(data * 100)
         else:
             return data
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Render maps to image buffers and encode them to image files """
+"""
+This file is part of wrfplot application.
+
+wrfplot is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as
+ published by the Free Software Foundation, either version 3 of the License, or any later version.
+
+wrfplot is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with wrfplot. If not,
+see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "J Sundar (wrf.guy@gmail.com)"
+
+from PIL import Image, PngImagePlugin, features
+
+# zlib compression level of PNG images. Same as the one used by matplotlib.
+PNG_COMPRESSION = 6
+# Number of colours of palette PNG images
+PALETTE_COLORS = 256
+# Formats of images, extension of their files and format of their animations
+FORMATS = ["png", "webp", "jpeg", "avif"]
+EXTENSIONS = {"png": "png", "webp": "webp", "jpeg": "jpg", "avif": "avif"}
+ANIMATION_FORMATS = {"png": "gif", "webp": "webp", "jpeg": "gif", "avif": "avif"}
+# Default quality (1 to 100) of lossy formats
+QUALITY = {"webp": 80, "jpeg": 85, "avif": 60}
+# Options of encoders of lossy formats trading a few percent in size of files for speed of encoding
+ENCODER_OPTIONS = {"webp": {"method": 2}, "jpeg": {}, "avif": {"speed": 8}}
+
+
+def available_formats():
+    """Get formats of images which can be saved with the installed Pillow
+
+    WebP and AVIF need Pillow to be built with libwebp and libavif respectively.
+
+    Returns:
+        list: Names of formats
+    """
+    return [
+        _format
+        for _format in FORMATS
+        if _format in ["png", "jpeg"] or features.check(_format)
+    ]
+
+
+def render(fig, dpi):
+    """Draw a figure once and copy its pixels
+
+    Figure is drawn at ``dpi`` in the same way as saving it with matplotlib, and set back to its own resolution
+    afterwards so that plots added later are placed the same way.
+
+    Args:
+        fig (Figure): Figure drawn with Agg canvas
+        dpi (int): Resolution of the image
+
+    Returns:
+        Image: RGBA image of the figure
+    """
+    fig_dpi = fig.dpi
+    fig.dpi = dpi
+    try:
+        fig.canvas.draw()
+        image = Image.frombuffer(
+            "RGBA", fig.canvas.get_width_height(), fig.canvas.buffer_rgba(), "raw", "RGBA", 0, 1
+        ).copy()
+    finally:
+        fig.dpi = fig_dpi
+
+    return image
+
+
+def image_nbytes(image):
+    """Number of bytes of pixels of an image"""
+    return image.width * image.height * len(image.getbands())
+
+
+def quantize(image):
+    """Quantize colours of an image to a palette of 8-bit colour indices
+
+    Args:
+        image (Image): RGBA image from ``render``
+
+    Returns:
+        Image: Image of 'P' mode
+    """
+    # Maps are opaque. Quantizing without alpha leaves no transparency in the palette.
+    return image.convert("RGB").quantize(PALETTE_COLORS, method=Image.Quantize.FASTOCTREE)
+
+
+def save_png(image, filename, dpi, compression=PNG_COMPRESSION, palette=False):
+    """Encode an image as PNG file
+
+    Args:
+        image (Image): RGBA image from ``render`` or image already quantized by ``quantize``
+        filename (str): Path to the image file
+        dpi (int): Resolution stored in the image file
+        compression (int): zlib compression level from 0 (none, fastest) to 9 (smallest, slowest)
+        palette (bool): True to quantize colours to a palette of 8-bit colour indices
+
+    Returns:
+        str: Path to the image file
+    """
+    import matplotlib as mpl
+
+    pnginfo = PngImagePlugin.PngInfo()
+    pnginfo.add_text(
+        "Software", "Matplotlib version{}, https://matplotlib.org/".format(mpl.__version__)
+    )
+    if palette and image.mode != "P":
+        image = quantize(image)
+    image.save(
+        filename,
+        format="png",
+        compress_level=compression,
+        dpi=(dpi, dpi),
+        pnginfo=pnginfo,
+    )
+
+    return filename
+
+
+def save_image(image, filename, dpi, fmt="png", quality=None, compression=PNG_COMPRESSION, palette=False):
+    """Encode an image in a given format
+
+    Args:
+        image (Image): RGBA image from ``render``
+        filename (str): Path to the image file
+        dpi (int): Resolution stored in the image file
+        fmt (str): One of FORMATS
+        quality (int): Quality from 1 to 100 of lossy formats. None to use default quality of the format.
+        compression (int): zlib compression level of PNG images
+        palette (bool): True to save PNG images with a palette of 8-bit colour indices
+
+    Returns:
+        str: Path to the image file
+    """
+    if fmt == "png":
+        return save_png(image, filename, dpi, compression=compression, palette=palette)
+    if quality is None:
+        quality = QUALITY[fmt]
+    # Maps are opaque. Lossy formats are smaller without alpha channel.
+    image.convert("RGB").save(
+        filename, format=fmt, quality=quality, dpi=(dpi, dpi), **ENCODER_OPTIONS[fmt]
+    )
+
+    return filename
+
+
+def save_animation(images, filename, duration, fmt="gif", quality=None):
+    """Encode images as an animation looping forever
+
+    Args:
+        images (list): Images of the animation in order
+        filename (str): Path to the animation file
+        duration (float): Milliseconds each image is shown
+        fmt (str): 'gif', 'webp' or 'avif'
+        quality (int): Quality from 1 to 100 of 'webp' and 'avif' animations. None to use default quality.
+
+    Returns:
+        str: Path to the animation file
+    """
+    if fmt == "gif":
+        img = images[0]
+        img.save(fp=filename, format='GIF', append_images=images, save_all=True, duration=duration, loop=0,
+                 optimize=True)
+        return filename
+    if quality is None:
+        quality = QUALITY[fmt]
+    images = [image.convert("RGB") for image in images]
+    images[0].save(
+        filename,
+        format=fmt,
+        append_images=images[1:],
+        save_all=True,
+        duration=int(duration),
+        loop=0,
+        quality=quality,
+        **ENCODER_OPTIONS[fmt]
+    )
+
+    return filename
@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Export fields as GeoTIFF or NetCDF files instead of plotting them """
+"""
+This file is part of wrfplot application.
+
+wrfplot is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as
+ published by the Free Software Foundation, either version 3 of the License, or any later version.
+
+wrfplot is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with wrfplot. If not,
+see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "J Sundar (wrf.guy@gmail.com)"
+
+import os
+from datetime import datetime
+import numpy as np
+import netCDF4 as nc
+from tqdm import tqdm
+import utils
+
+FORMATS = ["geotiff", "netcdf"]
+# Optional packages needed by formats. pyproj is used for projected coordinates when installed.
+REQUIRES = {"geotiff": "rasterio", "netcdf": None}
+LONLAT = "+proj=longlat +a=6370000 +b=6370000 +no_defs"  # Longitude and latitude on the sphere used by WRF
+BLOCK_SIZE = 256  # Width and height of tiles of GeoTIFF files and of their smallest overview
+NC_COMPLEVEL = 4  # zlib compression level of NetCDF variables
+
+
+def get_file_id(var_name, time_fcst, level=None):
+    """Name of files of a field without extension, same as the name of its image"""
+    file_id = "%s_%s" % (var_name, time_fcst)
+    if level is not None:
+        file_id = "%s_%s_%s" % (var_name, int(level), time_fcst)
+
+    return file_id.replace(" ", "_").replace(":", "_")
+
+
+def to_array(data):
+    """Values of a field or coordinates as numpy array, with invalid values masked"""
+    return np.ma.masked_invalid(getattr(data, "values", data))
+
+
+def plain_unit(unit):
+    """Unit without mathtext markup of titles, e.g. '$J kg^{1}$' to 'J kg^1'"""
+    return unit.replace("$", "").replace("{", "").replace("}", "")
+
+
+def project(proj4, lons, lats):
+    """Project longitudes and latitudes to a projection
+
+    Uses pyproj when installed or else rasterio, which bundles its own PROJ.
+
+    Args:
+        proj4 (str): PROJ.4 definition of the projection
+        lons: Longitudes in degrees
+        lats: Latitudes in degrees
+
+    Returns:
+        tuple: x and y in metres of the projection
+    """
+    try:
+        import pyproj
+    except ImportError:
+        from rasterio.warp import transform
+
+        x, y = transform(LONLAT, proj4, np.ravel(lons).tolist(), np.ravel(lats).tolist())
+        return np.reshape(x, np.shape(lons)), np.reshape(y, np.shape(lats))
+
+    transformer = pyproj.Transformer.from_crs(LONLAT, proj4, always_xy=True)
+
+    return transformer.transform(lons, lats)
+
+
+def grid_coords(proj4, lons, lats):
+    """Find x of columns and y of rows of a WRF grid in its own projection
+
+    Returns:
+        tuple: x of columns and y of rows in metres, or None when neither pyproj nor rasterio is installed
+    """
+    try:
+        x, y = project(proj4, np.ma.getdata(to_array(lons)), np.ma.getdata(to_array(lats)))
+    except ImportError:
+        return None
+
+    return np.mean(x, axis=0), np.mean(y, axis=1)
+
+
+def overview_factors(width, height):
+    """Decimation factors of overviews, halving the field until it fits in a single block"""
+    factors = []
+    factor = 2
+    while max(width, height) / factor >= BLOCK_SIZE / 2:
+        factors.append(factor)
+        factor = factor * 2
+
+    return factors
+
+
+def write_geotiff(filename, data, x, y, proj4, tags=None):
+    """Write a field as cloud optimized GeoTIFF
+
+    Field is written north up in tiles of BLOCK_SIZE, compressed with deflate and with averaged overviews stored
+    before the full resolution data, so that GIS clients can read parts of it without reading the whole file.
+
+    Args:
+        filename (str): Path to the GeoTIFF file
+        data (ndarray): 2D field with first row at south, as in WRF
+        x (ndarray): x of columns in metres of the projection
+        y (ndarray): y of rows in metres of the projection
+        proj4 (str): PROJ.4 definition of the projection
+        tags (dict): Metadata of the field, if any
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.io import MemoryFile
+    from rasterio.shutil import copy
+    from rasterio.transform import from_origin
+
+    height, width = data.shape
+    dx = (x[-1] - x[0]) / max(width - 1, 1)
+    dy = (y[-1] - y[0]) / max(height - 1, 1)
+    profile = dict(
+        driver="GTiff",
+        width=width,
+        height=height,
+        count=1,
+        dtype=data.dtype.name,
+        crs=rasterio.crs.CRS.from_proj4(proj4),
+        transform=from_origin(x[0] - dx / 2.0, y[-1] + dy / 2.0, dx, dy),
+        nodata=np.nan,
+    )
+    with MemoryFile() as memfile:
+        with memfile.open(**profile) as dataset:
+            dataset.write(np.flipud(data), 1)
+            dataset.update_tags(**(tags or {}))
+            factors = overview_factors(width, height)
+            if factors:
+                dataset.build_overviews(factors, Resampling.average)
+        # Copying with the overviews of the source lays them out ahead of the data as cloud optimized GeoTIFF needs
+        with memfile.open() as dataset:
+            copy(
+                dataset,
+                filename,
+                driver="GTiff",
+                tiled=True,
+                blockxsize=BLOCK_SIZE,
+                blockysize=BLOCK_SIZE,
+                compress="deflate",
+                predictor=3,
+                copy_src_overviews=True,
+            )
+
+
+class DataExport(object):
+    """Write fields in native WRF projection to GeoTIFF files (one per variable, level and time) or NetCDF files
+    (one per variable)"""
+
+    def __init__(self, fmt, output_dir, proj4, times, levels=None, moving=False, config=None):
+        """Create exporter
+
+        Args:
+            fmt (str): 'geotiff' or 'netcdf'
+            output_dir (str): Path to directory of exported files
+            proj4 (str): PROJ.4 definition of the projection of the domain
+            times (dict): Selected time indices and their times in increasing order
+            levels (list): Pressure levels of upper air variables in hPa
+            moving (bool): True for moving nests, whose coordinates differ between times
+            config (Mapping): Registry of variables giving their title and unit
+        """
+        super(DataExport, self).__init__()
+        self.fmt = fmt
+        self.output_dir = output_dir
+        self.proj4 = proj4
+        self.times = {idx_time: np.datetime64(_time, "m") for idx_time, _time in times.items()}
+        self.time_indices = list(self.times)
+        self.levels = list(levels or [])
+        self.moving = moving
+        self.config = config
+        self.coords = {}  # x of columns and y of rows of the grid of each time
+        self.datasets = {}  # Open NetCDF file of each variable
+
+    def get_coords(self, idx_time, lons, lats):
+        """Projected coordinates of the grid, computed once for static domains"""
+        key = idx_time if self.moving else None
+        if key not in self.coords:
+            self.coords[key] = grid_coords(self.proj4, lons, lats)
+
+        return self.coords[key]
+
+    def write(self, var_name, idx_time, time_fcst, data, lats, lons, level=None):
+        """Write field of a variable for a time and level
+
+        Args:
+            var_name (str): Name of the variable
+            idx_time (int): Time index in the unified time index
+            time_fcst (str): Formatted valid time
+            data: 2D field
+            lats: 2D latitudes of the grid
+            lons: 2D longitudes of the grid
+            level (float): Pressure level in hPa of upper air variables, None otherwise
+
+        Returns:
+            str: Path to the written file
+        """
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+        data = to_array(data)
+        data = np.ma.filled(data.astype(np.result_type(data.dtype, np.float32)), np.nan)
+        spec = self.config[var_name] if self.config is not None else None
+        if self.fmt == "geotiff":
+            filename = os.path.join(
+                self.output_dir, get_file_id(var_name, time_fcst, level) + ".tif"
+            )
+            tags = dict(variable=var_name, valid_time=time_fcst)
+            if spec is not None:
+                tags.update(long_name=spec.title, units=plain_unit(spec.unit))
+            if level is not None:
+                tags.update(level="%s hPa" % level)
+            x, y = self.get_coords(idx_time, lons, lats)
+            write_geotiff(filename, data, x, y, self.proj4, tags=tags)
+        else:
+            dataset = self.datasets.get(var_name)
+            if dataset is None:
+                dataset = self.open_netcdf(var_name, data, idx_time, lats, lons, level is not None)
+            idx = self.time_indices.index(idx_time)
+            dataset["time"][idx] = (self.times[idx_time] - self.times[self.time_indices[0]]) / np.timedelta64(1, "h")
+            if level is None:
+                dataset[var_name][idx] = data
+            else:
+                dataset[var_name][idx, self.levels.index(level)] = data
+            if self.moving:
+                dataset["lat"][idx] = to_array(lats)
+                dataset["lon"][idx] = to_array(lons)
+                coords = self.get_coords(idx_time, lons, lats)
+                if coords is not None:
+                    dataset["x"][idx], dataset["y"][idx] = coords
+            filename = dataset.filepath()
+        tqdm.write("\t  Data saved at : " + utils.quote(filename))
+
+        return filename
+
+    def open_netcdf(self, var_name, data, idx_time, lats, lons, upper):
+        """Create NetCDF file of a variable holding all selected times (and levels) of it
+
+        Variable is chunked by a 2D field and compressed, so that each field is read or written on its own.
+        """
+        first_time = self.times[self.time_indices[0]]
+        filename = os.path.join(
+            self.output_dir, "%s_%s.nc" % (var_name, first_time.astype(datetime).strftime("%d-%m-%Y_%H_%M"))
+        )
+        dataset = nc.Dataset(filename, "w", format="NETCDF4")
+        dataset.Conventions = "CF-1.8"
+        dataset.title = "Fields exported by wrfplot"
+        south_north, west_east = data.shape
+        dataset.createDimension("time", len(self.times))
+        dims = ["time"]
+        if upper:
+            dataset.createDimension("level", len(self.levels))
+            dims.append("level")
+            levels = dataset.createVariable("level", "f4", ("level",))
+            levels.units = "hPa"
+            levels.positive = "down"
+            levels.long_name = "pressure level"
+            levels[:] = self.levels
+        dataset.createDimension("south_north", south_north)
+        dataset.createDimension("west_east", west_east)
+        times = dataset.createVariable("time", "f8", ("time",))
+        times.units = "hours since %s" % first_time.astype(datetime).strftime("%Y-%m-%d %H:%M:%S")
+        times.calendar = "standard"
+        times.standard_name = "time"
+
+        # Coordinates of moving nests differ between times
+        coord_dims = ("time",) if self.moving else ()
+        lat = dataset.createVariable("lat", "f4", coord_dims + ("south_north", "west_east"), zlib=True)
+        lat.units = "degrees_north"
+        lat.standard_name = "latitude"
+        lon = dataset.createVariable("lon", "f4", coord_dims + ("south_north", "west_east"), zlib=True)
+        lon.units = "degrees_east"
+        lon.standard_name = "longitude"
+        if not self.moving:
+            lat[:] = to_array(lats)
+            lon[:] = to_array(lons)
+
+        crs = dataset.createVariable("crs", "i4")
+        crs.proj4 = self.proj4
+        coords = self.get_coords(idx_time, lons, lats)
+        if coords is not None:
+            x = dataset.createVariable("x", "f8", coord_dims + ("west_east",))
+            x.units = "m"
+            x.standard_name = "projection_x_coordinate"
+            y = dataset.createVariable("y", "f8", coord_dims + ("south_north",))
+            y.units = "m"
+            y.standard_name = "projection_y_coordinate"
+            if not self.moving:
+                x[:], y[:] = coords
+        try:
+            import pyproj
+
+            crs.crs_wkt = pyproj.CRS.from_proj4(self.proj4).to_wkt()
+        except ImportError:
+            pass
+
+        chunks = [1] * len(dims) + [south_north, west_east]
+        variable = dataset.createVariable(
+            var_name,
+            data.dtype,
+            tuple(dims) + ("south_north", "west_east"),
+            zlib=True,
+            complevel=NC_COMPLEVEL,
+            shuffle=True,
+            chunksizes=chunks,
+            fill_value=np.nan,
+        )
+        variable.coordinates = "lat lon"
+        variable.grid_mapping = "crs"
+        if self.config is not None:
+            variable.long_name = self.config[var_name].title
+            variable.units = plain_unit(self.config[var_name].unit)
+        self.datasets[var_name] = dataset
+
+        return dataset
+
+    def close(self):
+        """Close NetCDF files written so far"""
+        for dataset in self.datasets.values():
+            dataset.close()
+        self.datasets = {}
@@ -18,7 +18,9 @@ see <http://www.gnu.org/licenses/>.
 __author__ = "J Sundar (wrf.guy@gmail.com)"
 
 import os
+import numpy as np
 import netCDF4 as nc
+import wrf
 
 
 class FileIO(object):
@@ -28,7 +30,8 @@ class FileIO(object):
         super(FileIO, self).__init__()
         self.filepath = filepath
         self.file_type = None
-        self.header = self.read_file()
+        self.header = None
+        self.read_file()
 
     def validate_file(self):
         if not os.path.exists(self.filepath):
@@ -46,16 +49,268 @@ class FileIO(object):
             return True
 
     def is_netcdf(self):
-        """Check if given file is NetCDF type"""
-        if "CDF" in self.header:
+        """Check if given file is NetCDF type. NetCDF4 files are stored in HDF5 format."""
+        if "CDF" in self.header or "HDF" in self.header:
             self.file_type = "netcdf"
             return True
 
     def is_wrf(self):
         """Check if given file is WRF model output"""
-        if self.is_netcdf:
-            _file = nc.Dataset(self.filepath, "r")
-            if "MP_PHYSICS" in _file.ncattrs():
-                return True
+        if self.is_netcdf():
+            with nc.Dataset(self.filepath, "r") as _file:
+                if "MP_PHYSICS" in _file.ncattrs():
+                    return True
+        return False
+
+
+class WrfFileSet(object):
+    """Set of WRF output files accessed as a single time series
+
+    Times of all files are arranged in a single increasing time index. Files are opened only when their data is
+    needed and only one file is kept open at a time so that any number of files can be streamed through.
+    """
+
+    def __init__(self, filepaths):
+        super(WrfFileSet, self).__init__()
+        self.filepaths = list(filepaths)
+        self.times = []  # Valid times of the unified time index
+        self.index = []  # (file number, time index within file) for each time of the unified time index
+        self.attributes = []  # Global attributes of each file
+        self.window = None  # (south_north start, stop, west_east start, stop) of the sub-region, if any
+        self.dtype = None  # Data type to which floating point variables are converted while reading, if any
+        self._file_no = None
+        self._dataset = None
+        self._raw_dataset = None
+        self.build_index()
+
+    def __len__(self):
+        return len(self.filepaths)
+
+    def build_index(self):
+        """Read times of all files and build the unified time index
+
+        Files are ordered by their first time. Times repeated in a later file (e.g. overlapping restart output) are
+        taken from the earlier file only.
+        """
+        file_times = []
+        for file_no, filepath in enumerate(self.filepaths):
+            with nc.Dataset(filepath, "r") as dataset:
+                times = np.atleast_1d(
+                    wrf.extract_times(dataset, wrf.ALL_TIMES, meta=False)
+                )
+                self.attributes.append(
+                    {attr: dataset.getncattr(attr) for attr in dataset.ncattrs()}
+                )
+            file_times.append((times[0], file_no, times))
+
+        for _, file_no, times in sorted(file_times, key=lambda x: (x[0], x[1])):
+            for idx_time, _time in enumerate(times):
+                if len(self.times) > 0 and _time <= self.times[-1]:
+                    continue
+                self.times.append(_time)
+                self.index.append((file_no, idx_time))
+
+    def set_window(self, window):
+        """Restrict data read from all files to an index window of the horizontal grid
+
+        Args:
+            window (tuple): (south_north start, stop, west_east start, stop) with stop excluded, or None for full grid
+        """
+        self.close()
+        self.window = window
+
+    def set_dtype(self, dtype):
+        """Convert floating point variables read from all files to a data type
+
+        Args:
+            dtype (numpy.dtype): Data type (e.g. float32) or None to keep data type of files
+        """
+        self.close()
+        self.dtype = dtype
+
+    def dataset(self, file_no):
+        """Get opened dataset of a file. Previously opened file is closed.
+
+        When a window or data type is set, dataset is wrapped by ``WindowedDataset`` so that only the window is read
+        from the file and floating point variables are converted while reading.
+        """
+        if file_no != self._file_no:
+            self.close()
+            self._raw_dataset = nc.Dataset(self.filepaths[file_no], "r")
+            if self.window is None and self.dtype is None:
+                self._dataset = self._raw_dataset
+            else:
+                self._dataset = WindowedDataset(
+                    self._raw_dataset, window=self.window, dtype=self.dtype
+                )
+            self._file_no = file_no
+
+        return self._dataset
+
+    def locate(self, idx_time):
+        """Find dataset and time index within the dataset for a time of the unified time index
+
+        Args:
+            idx_time (int): Index of time in the unified time index
+
+        Returns:
+            tuple: Opened dataset and index of time within it
+        """
+        file_no, local_idx = self.index[idx_time]
+
+        return self.dataset(file_no), local_idx
+
+    def file_times(self, file_no):
+        """Indices of the unified time index that are taken from a given file"""
+        return [
+            idx_time
+            for idx_time, (_file_no, _) in enumerate(self.index)
+            if _file_no == file_no
+        ]
+
+    def close(self):
+        """Close the opened file, if any"""
+        if self._raw_dataset is not None:
+            self._raw_dataset.close()
+        self._dataset = None
+        self._raw_dataset = None
+        self._file_no = None
+
+
+class Dimension(object):
+    """Dimension of a ``WindowedDataset``. Behaves like ``netCDF4.Dimension`` for ``len`` and ``name``."""
+
+    def __init__(self, name, size):
+        super(Dimension, self).__init__()
+        self.name = name
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+
+class WindowedVariable(object):
+    """Variable of a ``WindowedDataset``
+
+    Horizontal dimensions of the variable are restricted to the window before reading from the file. Indexing is
+    relative to the window. Floating point data is converted to ``dtype`` after reading, when given. Attributes are
+    taken from the underlying ``netCDF4.Variable``.
+    """
+
+    __slots__ = ("_variable", "_slices", "_dtype", "shape")
+
+    def __init__(self, variable, slices, dtype=None):
+        self._variable = variable
+        self._slices = [slices.get(dim) for dim in variable.dimensions]
+        self._dtype = None
+        if dtype is not None and np.issubdtype(variable.dtype, np.floating):
+            self._dtype = np.dtype(dtype)
+        self.shape = tuple(
+            size if _slice is None else _slice.stop - _slice.start
+            for size, _slice in zip(variable.shape, self._slices)
+        )
+
+    @property
+    def __dict__(self):
+        # wrf-python reads attributes of variables through __dict__
+        return self._variable.__dict__
+
+    def __getattr__(self, name):
+        return getattr(self._variable, name)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def dtype(self):
+        return self._variable.dtype if self._dtype is None else self._dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(_key is Ellipsis for _key in key):
+            at = key.index(Ellipsis)
+            key = key[:at] + (slice(None),) * (self.ndim - len(key) + 1) + key[at + 1 :]
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        # Read the window of horizontal dimensions and apply the key of other dimensions while reading
+        read_key = []
+        window_key = []
+        for _key, _slice in zip(key, self._slices):
+            if _slice is None:
+                read_key.append(_key)
+                if not np.isscalar(_key):
+                    window_key.append(slice(None))
             else:
-                False
+                read_key.append(_slice)
+                window_key.append(_key)
+        data = self._variable[tuple(read_key)][tuple(window_key)]
+        if self._dtype is not None:
+            data = data.astype(self._dtype, copy=False)
+
+        return data
+
+
+class WindowedDataset(object):
+    """Read only view of a WRF output dataset restricted to an index window of the horizontal grid
+
+    It provides ``variables``, ``dimensions`` and global attributes the way ``netCDF4.Dataset`` does, so that it can
+    be used with ``wrf.getvar``. Raw variables are sliced while reading and diagnostics are computed only for the
+    window. Staggered dimensions get one more point than the window. When ``dtype`` is given, floating point variables
+    are converted to it while reading so that diagnostics are computed and returned in that data type.
+    """
+
+    def __init__(self, dataset, window=None, dtype=None):
+        super(WindowedDataset, self).__init__()
+        self.dataset = dataset
+        self.window = window
+        self.dtype = dtype
+        slices = {}
+        if window is not None:
+            j0, j1, i0, i1 = window
+            slices = {
+                "south_north": slice(j0, j1),
+                "south_north_stag": slice(j0, j1 + 1),
+                "west_east": slice(i0, i1),
+                "west_east_stag": slice(i0, i1 + 1),
+            }
+        self.variables = {
+            name: WindowedVariable(variable, slices, dtype=dtype)
+            for name, variable in dataset.variables.items()
+        }
+        self.dimensions = {}
+        for name, dimension in dataset.dimensions.items():
+            size = len(dimension)
+            if name in slices:
+                size = slices[name].stop - slices[name].start
+            self.dimensions[name] = Dimension(name, size)
+
+    def __getattr__(self, name):
+        return getattr(self.dataset, name)
+
+    def filepath(self):
+        """Path of the file with window and data type appended. wrf-python caches coordinates against the path."""
+        return "%s[%s,%s]" % (self.dataset.filepath(), self.window, self.dtype)
+
+    def ncattrs(self):
+        return self.dataset.ncattrs()
+
+    def getncattr(self, name):
+        return self.dataset.getncattr(name)
+
+    def window_field(self, field):
+        """Restrict a field computed from the full grid to the window"""
+        if self.window is None:
+            return field
+        j0, j1, i0, i1 = self.window
+        if hasattr(field, "isel"):
+            return field.isel(south_north=slice(j0, j1), west_east=slice(i0, i1))
+
+        return field[..., j0:j1, i0:i1]
+
+    def close(self):
+        self.dataset.close()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Run tasks of plotting variables in parallel with a pool of worker processes """
+"""
+This file is part of wrfplot application.
+
+wrfplot is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as
+ published by the Free Software Foundation, either version 3 of the License, or any later version.
+
+wrfplot is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with wrfplot. If not,
+see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "J Sundar (wrf.guy@gmail.com)"
+
+import io
+import multiprocessing
+import traceback
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from tqdm import tqdm
+
+_wrfplt = None  # WrfPlot of the worker process
+
+
+def init_worker(options, input_files, hours=None, valid=None, bbox=None):
+    """Create ``WrfPlot`` of a worker process
+
+    Each worker opens input file(s) through its own file handles and plots on its own figure.
+
+    Args:
+        options (dict): Keyword arguments of ``WrfPlot``
+        input_files (list): Paths to input files
+        hours (list): Forecast hours selected by user, if any
+        valid (list): Valid times selected by user, if any
+        bbox (list): Bounding box selected by user, if any
+    """
+    global _wrfplt
+    import wrf
+    from core import WrfPlot
+
+    wrf.enable_cartopy()
+    _wrfplt = WrfPlot(input_path=input_files, **options)
+    # Animations are made by the main process from the saved images
+    _wrfplt.keep_frames = False
+    _wrfplt.read_file(input_files)
+    _wrfplt.select_times(hours=hours, valid=valid)
+    if bbox is not None:
+        _wrfplt.set_bbox(bbox)
+
+
+def cache_counters(wrfplt):
+    """Counters of hits, misses and evictions of field cache and disk cache"""
+    counters = [
+        wrfplt.field_cache.hits,
+        wrfplt.field_cache.misses,
+        wrfplt.field_cache.evictions,
+    ]
+    if wrfplt.disk_cache is not None:
+        counters.extend(
+            [wrfplt.disk_cache.hits, wrfplt.disk_cache.misses, wrfplt.disk_cache.evictions]
+        )
+
+    return counters
+
+
+def add_cache_counters(wrfplt, counters):
+    """Add counters of caches of a worker process to the caches of ``wrfplt``"""
+    caches = [wrfplt.field_cache]
+    if wrfplt.disk_cache is not None:
+        caches.append(wrfplt.disk_cache)
+    for _cache, (hits, misses, evictions) in zip(
+        caches, zip(counters[0::3], counters[1::3], counters[2::3])
+    ):
+        _cache.hits = _cache.hits + hits
+        _cache.misses = _cache.misses + misses
+        _cache.evictions = _cache.evictions + evictions
+
+
+def run_task(graph):
+    """Run the graph of tasks of a time in a worker process
+
+    Messages are collected and returned so that they are written by the main process along with its progress bar.
+
+    Args:
+        graph (TaskGraph): Graph of tasks of a time
+
+    Returns:
+        tuple: Paths to images saved by each 'render' node, messages, increments of cache counters and traceback of
+        the error if plotting failed or else None
+    """
+    import planner
+
+    counters = cache_counters(_wrfplt)
+    messages = io.StringIO()
+    img_paths = {}
+    error = None
+    with redirect_stdout(messages):
+        try:
+            img_paths = planner.SerialExecutor(close_maps=False).run(_wrfplt, graph)
+        except Exception:
+            error = traceback.format_exc()
+    counters = [new - old for new, old in zip(cache_counters(_wrfplt), counters)]
+
+    return img_paths, messages.getvalue(), counters, error
+
+
+class PoolExecutor(object):
+    """Run a graph of tasks with a pool of worker processes
+
+    Tasks of each time are run by one of the workers, so that fields shared by variables of a time are computed once.
+    When there are fewer times than workers, each variable of a time is run separately.
+    Images are named after the variable, level and time, so they are same as plotting in a single process. Animations
+    are made by the main process once all times are plotted.
+    """
+
+    def __init__(self, workers, options, input_files, hours=None, valid=None, bbox=None, pbar=None):
+        """Create executor
+
+        Args:
+            workers (int): Number of worker processes
+            options (dict): Keyword arguments of ``WrfPlot`` for the workers
+            input_files (list): Paths to input files
+            hours (list): Forecast hours selected by user, if any
+            valid (list): Valid times selected by user, if any
+            bbox (list): Bounding box selected by user, if any
+            pbar (tqdm): Progress bar updated with number of plotted images, if any
+        """
+        super(PoolExecutor, self).__init__()
+        self.workers = workers
+        self.initargs = (options, input_files, hours, valid, bbox)
+        self.pbar = pbar
+
+    def run(self, wrfplt, graph):
+        """Run all nodes of a graph
+
+        Args:
+            wrfplt (WrfPlot): Object of the main process with input file(s) read and times selected
+            graph (TaskGraph): Graph of tasks
+
+        Returns:
+            dict: Paths to images saved by each 'render' node
+        """
+        import planner
+
+        renders = OrderedDict()
+        nodes = graph.stage_nodes("render")
+        by_time = len(set(node.idx_time for node in nodes)) >= self.workers
+        for node in nodes:
+            # Variables of a time are split among workers when there are fewer times than workers
+            key = node.idx_time if by_time else (node.idx_time, node.name)
+            renders.setdefault(key, []).append(node)
+        tasks = [graph.subgraph(nodes) for nodes in renders.values()]
+        img_paths = {}
+        failed = 0
+        # Workers are started afresh rather than forked so that open netCDF files are not shared with them
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(
+            processes=max(1, min(self.workers, len(tasks))),
+            initializer=init_worker,
+            initargs=self.initargs,
+        ) as pool:
+            for paths, messages, counters, error in pool.imap_unordered(run_task, tasks):
+                if messages:
+                    tqdm.write(messages.rstrip("\n"))
+                if error is not None:
+                    tqdm.write(error)
+                    failed = failed + 1
+                img_paths.update(paths)
+                add_cache_counters(wrfplt, counters)
+                if self.pbar is not None:
+                    self.pbar.update(sum(planner.frames(node) for node in paths))
+            # Leaving the pool terminates workers. They are let to exit cleanly so that their resources are released.
+            pool.close()
+            pool.join()
+
+        executor = planner.SerialExecutor()
+        for node in graph.stage_nodes("animate"):
+            executor.run_node(wrfplt, graph, node, {}, img_paths)
+        if failed > 0:
+            raise RuntimeError("Failed to plot %d of %d times" % (failed, len(tasks)))
+
+        return img_paths
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Plan the work needed for plotting variables as a graph of tasks and run it """
+"""
+This file is part of wrfplot application.
+
+wrfplot is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as
+ published by the Free Software Foundation, either version 3 of the License, or any later version.
+
+wrfplot is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with wrfplot. If not,
+see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "J Sundar (wrf.guy@gmail.com)"
+
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+from tqdm import tqdm
+import utils
+
+# Stages of the graph in the order they are run
+STAGES = ["read", "diagnostic", "accumulate", "interpolate", "render", "animate"]
+
+
+class Node(NamedTuple):
+    """Task of the graph
+
+    'read' and 'diagnostic' nodes get a raw variable or a diagnostic for a time, 'accumulate' reads precipitation of a
+    block of times starting at its time, 'interpolate' interpolates an upper air variable to all levels of a time,
+    'render' plots a variable for a time and 'animate' makes GIF of a variable.
+    """
+
+    stage: str
+    name: str
+    idx_time: Optional[int] = None
+    units: Optional[str] = None
+    levels: Optional[Tuple[float, ...]] = None
+
+    def describe(self, date_time):
+        """Describe the node in a single line"""
+        text = self.name
+        if self.units is not None:
+            text = "%s [%s]" % (text, self.units)
+        if self.levels is not None:
+            text = "%s at %s hPa" % (text, ",".join(str(level) for level in self.levels))
+        if self.idx_time is not None:
+            text = "%s for %s" % (text, date_time[self.idx_time])
+
+        return text
+
+
+class TaskGraph(object):
+    """Graph of tasks needed for plotting variables
+
+    Nodes are added along with their dependencies. A node requested again (e.g. 'pressure' of a time needed by several
+    upper air variables) is added only once. Nodes are kept in the order they are added, which is always an order in
+    which they can be run.
+    """
+
+    def __init__(self, var_names):
+        super(TaskGraph, self).__init__()
+        self.var_names = list(var_names)
+        self.nodes = OrderedDict()  # Dependencies of each node
+        self.requests = 0  # Number of times nodes are requested, including the repeated ones
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def add(self, node, deps=()):
+        """Add a node depending on ``deps`` unless it is already in the graph
+
+        Returns:
+            Node: The node added
+        """
+        self.requests = self.requests + 1
+        if node not in self.nodes:
+            self.nodes[node] = tuple(deps)
+
+        return node
+
+    def deps(self, node):
+        """Nodes on which a node depends"""
+        return self.nodes[node]
+
+    def dependents(self):
+        """Number of nodes depending on each node"""
+        count = {node: 0 for node in self.nodes}
+        for deps in self.nodes.values():
+            for dep in deps:
+                count[dep] = count[dep] + 1
+
+        return count
+
+    def subgraph(self, nodes):
+        """Graph of the given nodes and all of the nodes they depend on"""
+        wanted = set()
+        pending = list(nodes)
+        while pending:
+            node = pending.pop()
+            if node not in wanted:
+                wanted.add(node)
+                pending.extend(self.nodes[node])
+        graph = TaskGraph(self.var_names)
+        for node, deps in self.nodes.items():
+            if node in wanted:
+                graph.add(node, deps)
+
+        return graph
+
+    def stage_nodes(self, stage):
+        """Nodes of a stage"""
+        return [node for node in self.nodes if node.stage == stage]
+
+    def describe(self, date_time):
+        """Describe the plan i.e., number of nodes of each stage followed by each node and its dependencies
+
+        Args:
+            date_time (list): Formatted times of the unified time index
+
+        Returns:
+            str: Description of the plan
+        """
+        counts = ", ".join(
+            "%d %s" % (len(self.stage_nodes(stage)), stage) for stage in STAGES
+        )
+        lines = [
+            "Plan : %d tasks (%s). %d repeated requests are shared."
+            % (len(self.nodes), counts, self.requests - len(self.nodes))
+        ]
+        for node, deps in self.nodes.items():
+            line = "  %-12s %s" % (node.stage, node.describe(date_time))
+            if len(deps) > 0:
+                line = "%s <- %s" % (
+                    line,
+                    "; ".join(
+                        "%s %s" % (dep.stage, dep.describe(date_time)) for dep in deps
+                    ),
+                )
+            lines.append(line)
+
+        return "\n".join(lines)
+
+
+def plan(wrfplt, var_names):
+    """Expand variables to be plotted into a graph of tasks
+
+    Times are planned one after another, so that fields shared by variables of a time are computed once and can be
+    released before the next time. Renders whose data is available in the disk cache do not depend on any field.
+
+    Args:
+        wrfplt (WrfPlot): Object with input file(s) read and times selected
+        var_names (list): Names of variables to be plotted
+
+    Returns:
+        TaskGraph: Graph of tasks
+    """
+    graph = TaskGraph(var_names)
+    ulevels = wrfplt.ulevels if wrfplt.ulevels is not None else wrfplt.default_ulevels
+    renders = {var_name: [] for var_name in var_names}
+    selected = wrfplt.get_selected_times()
+    for idx_time in selected:
+        for var_name in var_names:
+            levels = tuple(ulevels) if "u_" in var_name else None
+            deps = []
+            if not in_disk_cache(wrfplt, var_name, idx_time, levels):
+                for name, units in wrfplt.required_fields(var_name):
+                    stage = "read" if name in wrfplt.nc_fh.variables else "diagnostic"
+                    deps.append(graph.add(Node(stage, name, idx_time, units)))
+                if var_name in ["ppn", "ppn_conv", "ppn_accum"]:
+                    block = wrfplt.get_precip_block(var_name, idx_time)
+                    deps.append(graph.add(Node("accumulate", var_name, block[0])))
+                if levels is not None:
+                    deps = [graph.add(Node("interpolate", var_name, idx_time, levels=levels), deps)]
+            renders[var_name].append(
+                graph.add(Node("render", var_name, idx_time, levels=levels), deps)
+            )
+            if wrfplt.animation is not False and idx_time == selected[-1]:
+                # Animation follows the last map of the variable, so that its frames are released early
+                graph.add(Node("animate", var_name), renders[var_name])
+
+    return graph
+
+
+def in_disk_cache(wrfplt, var_name, idx_time, levels=None):
+    """Check if data of a variable for a time, and all levels if any, is in the disk cache"""
+    if wrfplt.disk_cache is None:
+        return False
+    keys = [wrfplt.disk_cache_key(var_name, idx_time, level) for level in (levels or [None])]
+
+    return all(wrfplt.disk_cache.contains(key) for key in keys)
+
+
+def frames(node):
+    """Number of images plotted by a node"""
+    if node.stage != "render":
+        return 0
+
+    return 1 if node.levels is None else len(node.levels)
+
+
+class SerialExecutor(object):
+    """Run a graph of tasks one after another in the current process
+
+    Fields of 'read' and 'diagnostic' nodes and blocks of precipitation of 'accumulate' nodes are pinned in the field
+    cache of ``WrfPlot`` until all nodes depending on them are run. Levels interpolated by 'interpolate' nodes are held
+    until they are plotted. Map of a variable is closed after its last 'render' node.
+    """
+
+    def __init__(self, pbar=None, close_maps=True):
+        """Create executor
+
+        Args:
+            pbar (tqdm): Progress bar updated with frames plotted by 'render' nodes
+            close_maps (bool): Close map of a variable after its last 'render' node. Worker processes keep maps open
+                since they run the graph of each time separately.
+        """
+        super(SerialExecutor, self).__init__()
+        self.pbar = pbar
+        self.close_maps = close_maps
+
+    def run(self, wrfplt, graph):
+        """Run all nodes of a graph
+
+        Args:
+            wrfplt (WrfPlot): Object with input file(s) read and times selected
+            graph (TaskGraph): Graph of tasks
+
+        Returns:
+            dict: Paths to images saved by each 'render' node
+        """
+        remaining = graph.dependents()
+        results = {}
+        img_paths = {}
+        last_renders = {node.name: node for node in graph.stage_nodes("render")}
+        for node in graph:
+            result = self.run_node(wrfplt, graph, node, results, img_paths)
+            if node.stage == "render":
+                img_paths[node] = result
+                if self.pbar is not None:
+                    self.pbar.update(frames(node))
+                if self.close_maps and last_renders[node.name] == node:
+                    # Map of a variable is closed as soon as all of its times are plotted
+                    wrfplt.deactivate_variable(node.name)
+            elif node.stage == "interpolate" and remaining[node] > 0:
+                results[node] = result
+            for dep in graph.deps(node):
+                remaining[dep] = remaining[dep] - 1
+                if remaining[dep] == 0:
+                    self.release(wrfplt, dep, results)
+
+        return img_paths
+
+    def run_node(self, wrfplt, graph, node, results, img_paths):
+        """Run a node after all of its dependencies are run"""
+        if node.stage in ["read", "diagnostic"]:
+            # Field is pinned before it is computed so that it is kept even if cache is full
+            wrfplt.field_cache.pin((node.name, node.idx_time, node.units))
+            return wrfplt.get_field(node.name, node.idx_time, units=node.units)
+        elif node.stage == "accumulate":
+            # Block is pinned until all of its times are plotted so that it is read only once
+            wrfplt.field_cache.pin(wrfplt.precip_cache_key(node.name, node.idx_time))
+            if node.name == "ppn_accum":
+                return wrfplt.get_accumulated_precip(node.name, node.idx_time)
+            return wrfplt.get_precip_tendency(node.name, node.idx_time)
+        elif node.stage == "interpolate":
+            return wrfplt.extract_levels(node.name, node.idx_time, list(node.levels))
+        elif node.stage == "render":
+            wrfplt.activate_variable(node.name, first=node.name == graph.var_names[0])
+            fields = None
+            for dep in graph.deps(node):
+                if dep.stage == "interpolate":
+                    fields = results[dep]
+            return wrfplt.plot_time(node.name, node.idx_time, fields=fields)
+        elif node.stage == "animate":
+            wrfplt.get_time_period()
+            paths = []
+            for dep in graph.deps(node):
+                paths.extend(img_paths.get(dep, []))
+            return wrfplt.make_animation(var_name=node.name, img_paths=paths)
+
+    def release(self, wrfplt, node, results):
+        """Release result of a node once all nodes depending on it are run"""
+        results.pop(node, None)
+        if node.stage in ["read", "diagnostic"]:
+            wrfplt.field_cache.unpin((node.name, node.idx_time, node.units))
+        elif node.stage == "accumulate":
+            wrfplt.field_cache.unpin(wrfplt.precip_cache_key(node.name, node.idx_time))
+
+
+def run(wrfplt, graph, executor):
+    """Run a graph with an executor while showing progress of plotted images
+
+    Args:
+        wrfplt (WrfPlot): Object with input file(s) read and times selected
+        graph (TaskGraph): Graph of tasks
+        executor: ``SerialExecutor`` or ``parallel.PoolExecutor``
+
+    Returns:
+        dict: Paths to images saved by each 'render' node
+    """
+    tqdm.write(
+        "\n*** Initialising plotting for variable(s) : {_vars} ***\n".format(
+            _vars=", ".join(utils.quote(var_name) for var_name in graph.var_names)
+        )
+    )
+    with tqdm(
+        total=sum(frames(node) for node in graph),
+        desc="Completed",
+        leave=False,
+        position=0,
+        colour="green",
+    ) as pbar:
+        executor.pbar = pbar
+        return executor.run(wrfplt, graph)
@@ -24,15 +24,14 @@ from wrf import to_np, cartopy_xlim, cartopy_ylim, smooth2d
 import cartopy
 import numpy as np
 from cartopy import feature as cf
-from cartopy.feature import ShapelyFeature
-from cartopy.io.shapereader import Reader
 import cartopy.crs as ccrs
-from mpl_toolkits.axes_grid1 import make_axes_locatable
-import matplotlib.axes as maxes
+from matplotlib.ticker import MaxNLocator
 from tqdm import tqdm
-from matplotlib.colors import BoundaryNorm
 from cartopy.mpl.gridliner import LONGITUDE_FORMATTER, LATITUDE_FORMATTER
 import utils
+import basemap
+import encoder
+import tiles
 import warnings
 from shapely.errors import ShapelyDeprecationWarning
 
@@ -59,6 +58,14 @@ class PlotMap(object):
         dpi=150,
         config_file=None,
         disable_clabel=False,
+        coarsen=None,
+        shape_cache_dir=basemap.DEFAULT_SHAPE_CACHE_DIR,
+        shape_res="auto",
+        render="contour",
+        png_compression=encoder.PNG_COMPRESSION,
+        png_palette=False,
+        quality=None,
+        tiles=None,
     ):
         super(PlotMap, self).__init__()
         self.var_name = var_name
@@ -67,45 +74,126 @@ class PlotMap(object):
         self.ulevel = u_level
         self.fig = None
         self.ax = None
-        self.grd_lns = None  # Grid lines
+        self.layout = None  # Figure size and rectangles of map and colour bar applied to the figure
+        self.basemap_key = None  # Signature of the static layers added to the map
+        self.basemap_artists = []  # Static layers i.e., world shape, grid lines and their labels
         self.cf = None  # Contour fill
         self.cs = None  # Contour line
         self.cl = None  # Contour label
         self.barbs = None
-        self.fig_format = fig_format
+        self.fig_format = fig_format  # One of encoder.FORMATS
+        self.quality = quality  # Quality of lossy formats. None uses default quality of the format.
         self.output_dir = output_dir
         self.dpi = dpi
         self.config = config_file
         self.c_bar_extend = None
         self.cbar = None
+        self.cbar_key = None  # Levels, colour map and extension the colour bar is drawn for
         self.cax = None
         self.stream = None
         self.disable_clabel = disable_clabel
+        self.coarsen = coarsen  # None finds coarsening factor from the resolution of image
+        self.shape_cache_dir = shape_cache_dir  # Shapes clipped to domains are kept here across runs
+        self.shape_res = shape_res  # Resolution of coastlines and borders. 'auto' chooses it from size of pixels.
+        self.render = render  # 'contour' for filled contours or 'raster' for colouring grid cells
+        self.mesh = None  # Grid cells coloured in 'raster' mode. Kept across maps having the same grid.
+        self.mesh_grid = None  # Longitudes and latitudes of the grid of the mesh
+        self.png_compression = png_compression  # zlib compression level of saved images
+        self.png_palette = png_palette  # True to save images with a palette of 8-bit colour indices
+        self.image = None  # Pixels of the last saved map, which can be used without reading back the image file
+        self.tiles = tiles  # (lowest, highest) zoom levels to cut fields into tiles instead of saving maps
+        self.tile_grid = None  # Tiles of the highest zoom level covering the plotted domain
 
     def create_fig(self, projection):
-        """Create Fig"""
+        """Create Fig
+
+        Fields cut into tiles are plotted in Web Mercator on a transparent figure without any frame.
+        """
+        if self.tiles is not None:
+            projection = tiles.MERCATOR
         if self.proj is None:
             self.proj = projection
         if self.ax is None or self.fig is None:
             self.fig, self.ax = plt.subplots(
-                figsize=(12, 8),
+                figsize=utils.FIG_SIZE,
                 subplot_kw=dict(projection=self.proj),
-                frameon=True,
-                num=1,
-                clear=True,
+                frameon=self.tiles is None,
             )
-            self.add_shp_features()
-            self.add_grids()
-
-    def add_shp_features(self):
-        """Read shapefile and add as cartopy features"""
-        wld_shp_f = os.path.join(utils.data_dir(), "shape", "world_shape.shp")
-        wld_shp_features = ShapelyFeature(
-            Reader(wld_shp_f).geometries(), ccrs.PlateCarree(), facecolor="none"
-        )
-        self.ax.add_feature(
-            wld_shp_features, linewidth=0.5, edgecolor="black", alpha=0.7
+            if self.tiles is not None:
+                self.ax.set_position([0, 0, 1, 1])
+                self.ax.set_axis_off()
+                self.ax.patch.set_visible(False)
+
+    def set_projection(self, projection):
+        """Change projection of the map
+
+        Axes of a map can not change its projection. Therefore, figure is created again when the projection is
+        different from the current one (e.g. moving nests).
+        """
+        if self.proj is not None and (projection == self.proj or self.tiles is not None):
+            return
+        self.close_fig()
+        self.proj = None
+        self.create_fig(projection)
+
+    def close_fig(self):
+        """Close the figure so that the next map is plotted on a new figure
+
+        Colour bar leaves the axes resized and contour plots keep the extent of the previous map. Starting each
+        variable on a new figure makes its maps independent of the variable plotted before it.
+        """
+        if self.fig is not None:
+            plt.close(self.fig)
+        self.fig = self.ax = self.cax = None
+        self.cf = self.cs = self.cl = self.barbs = self.stream = None
+        self.mesh = self.mesh_grid = None
+        self.cbar = False
+        self.cbar_key = None
+        self.layout = None
+        self.tile_grid = None
+        self.basemap_key = None
+        self.basemap_artists = []
+
+    def add_basemap(self):
+        """Add static layers (world shape, grid lines and their labels) drawn for the extent and layout of the map
+
+        Static layers are drawn once for a projection, extent and layout and reused by every map having the same.
+        They are added again only when the map no longer matches the ones already added (e.g. moving nests).
+        """
+        self.apply_layout()
+        key = basemap.signature(self.ax, self.dpi, self.shape_res)
+        if key == self.basemap_key:
+            return
+        for artist in self.basemap_artists:
+            artist.remove()
+        self.basemap_artists = basemap.get_basemap(key, self.shape_cache_dir).add_to(
+            self.ax
         )
+        self.basemap_key = key
+
+    def coarsen_data(self, var_name, lons, lats, data):
+        """Coarsen data and coordinates when the grid has more points than the pixels of the image
+
+        Contouring a grid finer than the image only costs time without adding any detail. Blocks of grid points are
+        averaged, or their maximum is taken for variables having 'coarsen=max' in config (e.g. reflectivity) so that
+        peaks are kept. Outer rows and columns of the coarsened grid lie on the edges of the grid, so that the map is
+        filled up to its edges.
+
+        Returns:
+            Longitudes, latitudes and data. Same as inputs when coarsening is not needed.
+        """
+        factor = self.coarsen
+        if factor is None and self.tiles is not None:
+            # Pixels of tiles depend on the zoom level and not on the resolution of image
+            factor = 1
+        if factor is None:
+            factor = utils.get_coarsen_factor(np.shape(data), self.dpi)
+        if factor <= 1:
+            return lons, lats, data
+
+        c_lons, c_lats = utils.coarsen_coords(to_np(lons), to_np(lats), factor)
+
+        return c_lons, c_lats, utils.coarsen(to_np(data), factor, method=self.config[var_name].coarsen)
 
     def contour(
         self, var_name, lons, lats, data, title, clevels, fcst_time, colors="blue"
@@ -113,9 +201,11 @@ class PlotMap(object):
         self.clear_plots()
         if var_name == "slp":
             data = smooth2d(data, 3, cenweight=4)
+        c_lons, c_lats, data = self.coarsen_data(var_name, lons, lats, data)
+        if var_name == "slp":
             self.cs = self.ax.contour(
-                lons,
-                lats,
+                c_lons,
+                c_lats,
                 data,
                 colors=colors,
                 transform=ccrs.PlateCarree(),
@@ -124,15 +214,18 @@ class PlotMap(object):
             )
         else:
             self.cs = self.ax.contour(
-                lons,
-                lats,
+                c_lons,
+                c_lats,
                 data,
                 colors="blue",
                 transform=ccrs.PlateCarree(),
                 linewidths=0.5,
                 levels=self.clevels,
             )
+        if self.tiles is not None:
+            return self.save_tiles(var=var_name, fcst_time=fcst_time, lons=lons, lats=lats)
 
+        self.apply_layout()
         self.cl = self.ax.clabel(
             self.cs, inline=1, fontsize=10, fmt="%1.0f", inline_spacing=1
         )
@@ -174,7 +267,7 @@ class PlotMap(object):
                 transform=ccrs.PlateCarree(),
             )
         if var_name not in ["u_stream", "u_winds_temp"]:
-            self.contour_fill(
+            img_path = self.contour_fill(
                 var_name=var_name,
                 lons=lons,
                 lats=lats,
@@ -184,7 +277,11 @@ class PlotMap(object):
                 colors=colors,
                 cmap=cmap,
                 fcst_time=fcst_time,
+                level=level,
             )
+            if self.tiles is not None:
+                # Barbs are drawn for the size of a map and do not scale to zoom levels of tiles
+                return img_path
             self.barbs = self.ax.barbs(
                 to_np(lons)[::thin, ::thin],
                 to_np(lats)[::thin, ::thin],
@@ -215,36 +312,85 @@ class PlotMap(object):
         if isinstance(clevels, int):
             bnorm = "linear"
         else:
-            bnorm = BoundaryNorm(clevels, cmap.N)
+            cmap, bnorm = utils.get_cmap_norm(cmap, clevels)
         if self.c_bar_extend is None:
-            self.c_bar_extend = utils.get_cbar_extend(var_name)
+            self.c_bar_extend = utils.get_cbar_extend(self.config[var_name])
         self.clear_plots()
-        self.cf = self.ax.contourf(
-            lons,
-            lats,
-            data,
-            transform=ccrs.PlateCarree(),
-            cmap=cmap,
-            norm=bnorm,
-            levels=clevels,
-            extend=self.c_bar_extend,
-        )
-        self.cs = self.ax.contour(
-            self.cf, colors=colors, transform=ccrs.PlateCarree(), linewidths=0.3
-        )
-
-        if self.disable_clabel is False:
-            self.cl = self.ax.clabel(
-                self.cs, inline=1, fontsize=6, fmt="%1.0f", inline_spacing=1
+        c_lons, c_lats, data = self.coarsen_data(var_name, lons, lats, data)
+        if self.render == "raster":
+            self.raster(c_lons, c_lats, data, cmap, clevels)
+        else:
+            self.cf = self.ax.contourf(
+                c_lons,
+                c_lats,
+                data,
+                transform=ccrs.PlateCarree(),
+                cmap=cmap,
+                norm=bnorm,
+                levels=clevels,
+                extend=self.c_bar_extend,
+            )
+            self.cs = self.ax.contour(
+                self.cf, colors=colors, transform=ccrs.PlateCarree(), linewidths=0.3
             )
+        if self.tiles is not None:
+            return self.save_tiles(var=var_name, fcst_time=fcst_time, _level=level, lons=lons, lats=lats)
 
         self.plot_title(title)
         self.set_xy_lim(lons=lons, lats=lats)
         self.add_cbar(var_name=var_name, clevels=clevels)
 
+        if self.disable_clabel is False and self.cs is not None:
+            self.apply_layout()
+            self.cl = self.ax.clabel(
+                self.cs, inline=1, fontsize=6, fmt="%1.0f", inline_spacing=1
+            )
+
         if var_name not in ["winds", "u_winds"]:
             return self.save_fig(var=var_name, fcst_time=fcst_time, _level=level)
 
+    def raster(self, lons, lats, data, cmap, clevels):
+        """Colour each grid cell by the contour level its value falls in
+
+        Cells are coloured with the same colour map and levels as filled contours, but without tracing contours.
+        Mesh of the grid is created once and only its data is updated for the following maps of the same grid.
+
+        Args:
+            lons: 2D longitudes of the grid
+            lats: 2D latitudes of the grid
+            data: 2D data to be plotted
+            cmap: Name of the colour map or Maplotlib's cmap instance
+            clevels: Contour levels as list or number of levels as int
+        """
+        data = np.ma.masked_invalid(to_np(data))
+        if isinstance(clevels, int):
+            # Same levels as 'contourf' would choose
+            clevels = MaxNLocator(clevels + 1).tick_values(np.min(data), np.max(data))
+        cmap, bnorm = utils.get_cmap_norm(cmap, clevels)
+        lons, lats = to_np(lons), to_np(lats)
+        if (
+            self.mesh is not None
+            and np.array_equal(self.mesh.norm.boundaries, bnorm.boundaries)
+            and np.array_equal(self.mesh_grid[0], lons)
+            and np.array_equal(self.mesh_grid[1], lats)
+        ):
+            self.mesh.set_array(data)
+            return
+        if self.mesh is not None:
+            self.mesh.remove()
+        # Grid is projected once, so that drawing the mesh needs no further transformation
+        points = self.proj.transform_points(ccrs.PlateCarree(), lons, lats)
+        self.mesh = self.ax.pcolormesh(
+            points[..., 0],
+            points[..., 1],
+            data,
+            shading="nearest",
+            transform=self.proj,
+            cmap=cmap,
+            norm=bnorm,
+        )
+        self.mesh_grid = (lons, lats)
+
     def plot_title(self, title_text=""):
         self.ax.set_title(
             title_text,
@@ -256,34 +402,66 @@ class PlotMap(object):
         )
 
     def add_cbar(self, var_name, clevels):
-        """Plot colorbar next to plotted axes"""
+        """Plot colorbar next to plotted axes
+
+        Colour bar is drawn from its own levels and colour map, which are not affected by removing the plot it was
+        created for. It is therefore kept across maps and created again only when levels, colour map or extension of
+        the plotted map differ from the ones it is drawn for (e.g. levels computed from data of each time).
+        """
         # 'neither', 'both', 'min', 'max'
         if self.c_bar_extend is None:
-            self.c_bar_extend = self.config[var_name]["c_bar_extend"]
+            self.c_bar_extend = self.config[var_name].c_bar_extend
 
+        mappable = self.cf if self.cf is not None else self.mesh
+        levels = mappable.levels if self.cf is not None else mappable.norm.boundaries
+        key = (tuple(np.ravel(levels)), tuple(np.ravel(clevels)), mappable.cmap, self.c_bar_extend)
+        if self.cbar and key != self.cbar_key:
+            self.cax.remove()
+            self.cbar = False
         if not self.cbar:
-            # F = plt.gcf()
-            divider = make_axes_locatable(self.ax)
-            self.cax = divider.append_axes(
-                "right", size="3.0%", pad=0.2, axes_class=maxes.Axes
-            )
-            self.fig.add_axes(self.cax)
+            self.cax = self.fig.add_axes(self.apply_layout(cbar=True)[1])
+            self.cbar_key = key
             self.cbar = plt.colorbar(
-                self.cf, cax=self.cax, orientation="vertical", extend=self.c_bar_extend
+                mappable,
+                cax=self.cax,
+                orientation="vertical",
+                extend=self.c_bar_extend,
             )
-            unit = self.config[var_name]["unit"].replace('"', "")
+            unit = self.config[var_name].unit.replace('"', "")
             self.cbar.set_ticks(clevels)
             self.cbar.ax.tick_params(labelsize=8)
             self.cbar.set_label(label=unit, size="large", weight="bold")
             self.cbar.ax.text(0.5, 0, "", va="top", ha="center")
 
-    def add_grids(self):
-        """Add grid lines to plot"""
-        self.grd_lns = self.ax.gridlines(
-            draw_labels=True, color="gray", alpha=0.5, linestyle="--"
-        )
-        self.grd_lns.top_labels = False
-        self.grd_lns.right_labels = False
+    def apply_layout(self, cbar=None):
+        """Fit the figure to the aspect ratio of the map and place the map and colour bar where they will be drawn
+
+        Layout is computed from the extent of the map and applied only when it changes, so that every map of a
+        variable is saved in a single draw at the same size. Contour labels are placed in screen space. Applying the
+        layout before adding them places labels of a map the same way irrespective of the maps plotted previously on
+        the figure.
+
+        Args:
+            cbar (bool): True to leave room for colour bar. None to leave it only when colour bar is added.
+
+        Returns:
+            tuple: Rectangles of map and colour bar in figure coordinates
+        """
+        if cbar is None:
+            cbar = self.cax is not None
+        x_0, x_1 = self.ax.get_xlim()
+        y_0, y_1 = self.ax.get_ylim()
+        layout = utils.get_fig_layout(abs((y_1 - y_0) / (x_1 - x_0)), cbar=cbar)
+        if layout != self.layout:
+            fig_size, ax_rect, cax_rect = layout
+            self.fig.set_size_inches(fig_size)
+            self.ax.set_position(ax_rect)
+            if self.cax is not None and cax_rect is not None:
+                self.cax.set_position(cax_rect)
+            self.layout = layout
+        self.ax.apply_aspect()
+
+        return layout[1:]
 
     def set_xy_lim(self, lons, lats):
         self.ax.set_extent(
@@ -298,29 +476,74 @@ class PlotMap(object):
         file_id = "%s_%s" % (var, fcst_time)
         if "u_" in var:
             file_id = "%s_%s_%s" % (var, int(_level), fcst_time)
-        filename = "%s.%s" % (file_id.replace(" ", "_"), self.fig_format)
+        filename = "%s.%s" % (
+            file_id.replace(" ", "_"),
+            encoder.EXTENSIONS[self.fig_format],
+        )
         # Windows fix
         # Widows does not accept a file containing ":" in the file name. So replace it with '_'.
         filename = filename.replace(":", "_")
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
-        # plt.savefig(os.path.join(self.output_dir, filename), bbox_inches="tight", dpi=self.dpi)
-        self.fig.savefig(
+        self.add_basemap()
+        # Figure is already fitted to the map. Cropping it to tight bounding box would draw it twice.
+        self.image = encoder.render(self.fig, self.dpi)
+        if self.png_palette and self.fig_format == "png":
+            # Image is kept as saved, so that animations made from it look same as the saved images
+            self.image = encoder.quantize(self.image)
+        img_path = encoder.save_image(
+            self.image,
             os.path.join(self.output_dir, filename),
-            bbox_inches="tight",
             dpi=self.dpi,
-            format="png",
+            fmt=self.fig_format,
+            quality=self.quality,
+            compression=self.png_compression,
+            palette=self.png_palette,
         )
         # self.clear_plots()
-        if os.path.exists(os.path.join(self.output_dir, filename)):
-            tqdm.write(
-                "\t  Image saved at : "
-                + utils.quote(os.path.join(self.output_dir, filename))
+        tqdm.write("\t  Image saved at : " + utils.quote(img_path))
+
+        return img_path
+
+    def save_tiles(self, var, fcst_time, lons, lats, _level=None):
+        """Cut plotted field into XYZ tiles of all zoom levels
+
+        Field is drawn once covering the tiles of the highest zoom level and halved for each lower zoom level. Tiles
+        are saved in a directory named same as the image of the map would be.
+
+        Returns:
+            str: Path to the directory of tiles
+        """
+        file_id = "%s_%s" % (var, fcst_time)
+        if "u_" in var:
+            file_id = "%s_%s_%s" % (var, int(_level), fcst_time)
+        tile_dir = os.path.join(
+            self.output_dir, "tiles", file_id.replace(" ", "_").replace(":", "_")
+        )
+        lons, lats = to_np(lons), to_np(lats)
+        bounds = (np.nanmin(lons), np.nanmax(lons), np.nanmin(lats), np.nanmax(lats))
+        if self.tile_grid is None or self.tile_grid.bounds != bounds:
+            self.tile_grid = tiles.TileGrid(lons, lats, *self.tiles)
+            self.fig.set_size_inches(
+                self.tile_grid.width / tiles.TILE_SIZE,
+                self.tile_grid.height / tiles.TILE_SIZE,
             )
+        x_0, x_1, y_0, y_1 = self.tile_grid.extent
+        # Plots may have autoscaled the axes to their data
+        self.ax.set_xlim(x_0, x_1)
+        self.ax.set_ylim(y_0, y_1)
+        fmt = "webp" if self.fig_format == "webp" else "png"
+        saved = tiles.save_pyramid(
+            encoder.render(self.fig, tiles.TILE_SIZE),
+            self.tile_grid,
+            tile_dir,
+            fmt=fmt,
+            quality=self.quality,
+            compression=self.png_compression,
+        )
+        tqdm.write("\t  %d tiles saved at : %s" % (saved, utils.quote(tile_dir)))
 
-            return os.path.join(self.output_dir, filename)
-        else:
-            return None
+        return tile_dir
 
     def clear_plots(self):
         try:
@@ -330,9 +553,6 @@ class PlotMap(object):
                 self.cf.remove()
             if self.barbs:
                 self.barbs.remove()
-            if self.cax:
-                self.cax.remove()
-                self.cbar = False
             if self.stream:
                 self.stream.remove()
                 for collection in self.stream:
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Cut plotted fields into XYZ tiles of Web Mercator for web maps """
+"""
+This file is part of wrfplot application.
+
+wrfplot is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as
+ published by the Free Software Foundation, either version 3 of the License, or any later version.
+
+wrfplot is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with wrfplot. If not,
+see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "J Sundar (wrf.guy@gmail.com)"
+
+import math
+import os
+import numpy as np
+import cartopy.crs as ccrs
+from PIL import Image
+from tqdm import tqdm
+import encoder
+
+MERCATOR = ccrs.GOOGLE_MERCATOR  # Web Mercator (EPSG:3857) used by web maps
+ORIGIN = 20037508.342789244  # Half of the circumference of the earth in Web Mercator metres
+MAX_LAT = 85.0511287798  # Latitude at which Web Mercator is cut into a square
+TILE_SIZE = 256  # Width and height of a tile in pixels
+MAX_ZOOM = 22
+# Largest image of the highest zoom level. Higher zoom levels are dropped for domains needing larger images.
+MAX_PIXELS = 64 * 1024 * 1024
+
+
+def lon_lat_to_tile(lon, lat, zoom):
+    """Find position of a point in tiles of a zoom level
+
+    Args:
+        lon (float): Longitude in degrees
+        lat (float): Latitude in degrees
+        zoom (int): Zoom level
+
+    Returns:
+        tuple: x and y in units of tiles from north-west corner of the world, with fractions
+    """
+    lat = math.radians(min(max(lat, -MAX_LAT), MAX_LAT))
+    tiles = 2 ** zoom
+    x = (lon + 180.0) / 360.0 * tiles
+    y = (1.0 - math.log(math.tan(lat) + 1.0 / math.cos(lat)) / math.pi) / 2.0 * tiles
+
+    return x, y
+
+
+class TileGrid(object):
+    """Tiles of the highest zoom level covering a domain"""
+
+    def __init__(self, lons, lats, min_zoom, max_zoom):
+        """Find tiles covering longitudes and latitudes of a domain
+
+        Args:
+            lons: 2D longitudes of the grid
+            lats: 2D latitudes of the grid
+            min_zoom (int): Lowest zoom level
+            max_zoom (int): Highest zoom level. Lowered when the domain needs an image larger than MAX_PIXELS.
+        """
+        super(TileGrid, self).__init__()
+        self.bounds = (
+            float(np.nanmin(lons)),
+            float(np.nanmax(lons)),
+            float(np.nanmin(lats)),
+            float(np.nanmax(lats)),
+        )
+        self.min_zoom = min_zoom
+        zoom = max_zoom
+        while True:
+            self.set_zoom(zoom)
+            if zoom <= min_zoom or self.width * self.height <= MAX_PIXELS:
+                break
+            zoom = zoom - 1
+        if zoom < max_zoom:
+            tqdm.write(
+                f"\tTiles are made up to zoom level {zoom} as higher zoom levels need too large images for the domain"
+            )
+
+    def set_zoom(self, zoom):
+        """Find tiles of a zoom level covering the domain"""
+        west, east, south, north = self.bounds
+        x_0, y_0 = lon_lat_to_tile(west, north, zoom)
+        x_1, y_1 = lon_lat_to_tile(east, south, zoom)
+        self.max_zoom = zoom
+        self.x_0, self.y_0 = int(x_0), int(y_0)
+        # Tiles up to and including the one having the south-east corner
+        self.x_1 = min(int(x_1) + 1, 2 ** zoom)
+        self.y_1 = min(int(y_1) + 1, 2 ** zoom)
+
+    @property
+    def width(self):
+        """Width of the image of the highest zoom level in pixels"""
+        return (self.x_1 - self.x_0) * TILE_SIZE
+
+    @property
+    def height(self):
+        """Height of the image of the highest zoom level in pixels"""
+        return (self.y_1 - self.y_0) * TILE_SIZE
+
+    @property
+    def extent(self):
+        """Limits of x and y in Web Mercator metres covered by the tiles of the highest zoom level"""
+        size = 2.0 * ORIGIN / 2 ** self.max_zoom
+        return (
+            -ORIGIN + self.x_0 * size,
+            -ORIGIN + self.x_1 * size,
+            ORIGIN - self.y_1 * size,
+            ORIGIN - self.y_0 * size,
+        )
+
+
+def save_tile(tile, filename, fmt="png", quality=None, compression=encoder.PNG_COMPRESSION):
+    """Encode a tile keeping its transparency
+
+    Args:
+        tile (Image): RGBA image of a tile
+        filename (str): Path to the tile file
+        fmt (str): 'png' or 'webp'
+        quality (int): Quality of 'webp' tiles. None to use default quality.
+        compression (int): zlib compression level of 'png' tiles
+    """
+    if fmt == "webp":
+        if quality is None:
+            quality = encoder.QUALITY[fmt]
+        tile.save(filename, format=fmt, quality=quality, **encoder.ENCODER_OPTIONS[fmt])
+    else:
+        tile.save(filename, format="png", compress_level=compression)
+
+
+def save_pyramid(image, grid, output_dir, fmt="png", quality=None, compression=encoder.PNG_COMPRESSION):
+    """Cut an image of the highest zoom level into tiles of all zoom levels
+
+    Each lower zoom level is made by halving the one above it, so the field is drawn only once. Tiles having no
+    visible pixel are not saved. Tiles are saved as ``<output_dir>/<zoom>/<x>/<y>.<extension>``.
+
+    Args:
+        image (Image): RGBA image covering tiles of ``grid`` at its highest zoom level
+        grid (TileGrid): Tiles covering the domain
+        output_dir (str): Path to directory of tiles
+        fmt (str): 'png' or 'webp'
+        quality (int): Quality of 'webp' tiles. None to use default quality.
+        compression (int): zlib compression level of 'png' tiles
+
+    Returns:
+        int: Number of tiles saved
+    """
+    # Colours are premultiplied by alpha, so that transparent pixels do not bleed into their neighbours when halving
+    image = image.convert("RGBa")
+    x_0, y_0 = grid.x_0, grid.y_0
+    saved = 0
+    for zoom in range(grid.max_zoom, grid.min_zoom - 1, -1):
+        if zoom < grid.max_zoom:
+            # Pad the image to whole tiles of the lower zoom level before halving it
+            left, top = (x_0 % 2) * TILE_SIZE, (y_0 % 2) * TILE_SIZE
+            step = 2 * TILE_SIZE
+            width = -(-(image.width + left) // step) * step
+            height = -(-(image.height + top) // step) * step
+            padded = Image.new("RGBa", (width, height))
+            padded.paste(image, (left, top))
+            image = padded.reduce(2)
+            x_0, y_0 = x_0 // 2, y_0 // 2
+        for row in range(image.height // TILE_SIZE):
+            for col in range(image.width // TILE_SIZE):
+                box = (col * TILE_SIZE, row * TILE_SIZE, (col + 1) * TILE_SIZE, (row + 1) * TILE_SIZE)
+                tile = image.crop(box)
+                if tile.getchannel(3).getbbox() is None:
+                    continue
+                tile_dir = os.path.join(output_dir, str(zoom), str(x_0 + col))
+                os.makedirs(tile_dir, exist_ok=True)
+                save_tile(
+                    tile.convert("RGBA"),
+                    os.path.join(tile_dir, "%d.%s" % (y_0 + row, encoder.EXTENSIONS[fmt])),
+                    fmt=fmt,
+                    quality=quality,
+                    compression=compression,
+                )
+                saved = saved + 1
+
+    return saved
@@ -18,40 +18,119 @@ see <http://www.gnu.org/licenses/>.
 __author__ = "J Sundar (wrf.guy@gmail.com)"
 
 import numpy as np
-import matplotlib.pyplot as plt
+import matplotlib
 import os
+import glob
 import socket
-import colormaps as cmaps
-import configparser
+import warnings
+from collections import OrderedDict
+from matplotlib.colors import BoundaryNorm
+
+# Coarsening factor used by preview mode
+PREVIEW_COARSEN = 4
+# Maximum number of (cmap, norm) pairs kept for reuse
+MAX_CMAP_NORMS = 64
+
+# Layout of maps in inches. Map is fitted within MAP_BOX keeping the aspect ratio of the domain and figure is sized to
+# the map leaving MAP_MARGINS (left, bottom, right, top) for grid labels and title around it.
+FIG_SIZE = (12, 8)  # Size of figure before it is fitted to the map
+MAP_BOX = (9.3, 6.16)
+MAP_MARGINS = (0.6, 0.3, 0.3, 0.55)
+CBAR_PAD = 0.2  # Space between map and colour bar
+CBAR_WIDTH = 0.03  # Width of colour bar as fraction of width of map
+CBAR_MARGIN = 0.7  # Space right of colour bar for its ticks and label
+
+_cmap_index = None  # Index of supported colour map names
+_cmaps = {}  # Colour maps created so far
+_cmap_norms = OrderedDict()  # (cmap, norm) pairs created so far
+
+
+def get_cmap_index():
+    """Get index of names of all supported colour maps
+
+    Index is built on first use from names registered with matplotlib and names provided by 'colormaps' package.
+    'colormaps' package lists its colour maps without loading them. Colour maps of 'colormaps' package take
+    precedence over the ones of matplotlib having same name.
+
+    Returns:
+        dict: Name of colour map to the package providing it i.e., 'colormaps' or 'matplotlib'
+    """
+    global _cmap_index
+    if _cmap_index is None:
+        import colormaps as cmaps
+
+        _cmap_index = {name: "matplotlib" for name in matplotlib.colormaps}
+        for name in dir(cmaps):
+            if not name.startswith("_") and name not in ["register_all", "register_collection"]:
+                _cmap_index[name] = "colormaps"
+
+    return _cmap_index
 
 
 def get_cmap(name):
     """Get colour map for a specific string name
+
+    Colour maps are looked up in the index of colour maps and created only once.
+
     Args:
         name (str): Name of the colour map
 
     Returns:
         cmap: Maplotlib's cmap instance
     """
-    all_cmap = dir(cmaps)
-    mpl_cmaps = plt.colormaps()
-    if name in all_cmap:
-        return getattr(cmaps, name)
-    elif name in mpl_cmaps:
-        return plt.get_cmap(name)
-
     if isinstance(name, list):
         return name
+    if name in _cmaps:
+        return _cmaps[name]
 
+    source = get_cmap_index().get(name)
+    cmap = None
     try:
-        cmap = getattr(cmaps, name)
-    except AttributeError:
+        if source == "colormaps":
+            import colormaps as cmaps
+
+            cmap = getattr(cmaps, name)
+        elif source == "matplotlib":
+            cmap = matplotlib.colormaps[name]
+    except (AttributeError, KeyError):
+        # Colour map listed in the index is not provided by the installed version of the package
+        cmap = None
+    if cmap is None:
         print("Defaulting to 'rainbow' colormap.")
-        cmap = plt.get_cmap('rainbow')
+        cmap = matplotlib.colormaps['rainbow']
+    _cmaps[name] = cmap
 
     return cmap
 
 
+def get_cmap_norm(cmap, clevels):
+    """Get colour map and boundary norm for contour levels
+
+    Pairs of colour map and norm are created once for a colour map and contour levels and reused afterwards.
+
+    Args:
+        cmap: Name of the colour map or Maplotlib's cmap instance
+        clevels (list): Contour levels
+
+    Returns:
+        tuple: Maplotlib's cmap and BoundaryNorm instance
+    """
+    name = cmap if isinstance(cmap, str) else cmap.name
+    key = (name, tuple(np.asarray(clevels).ravel().tolist()))
+    if key in _cmap_norms:
+        _cmap_norms.move_to_end(key)
+        return _cmap_norms[key]
+
+    if isinstance(cmap, str):
+        cmap = get_cmap(cmap)
+    _cmap_norms[key] = (cmap, BoundaryNorm(clevels, cmap.N))
+    # Levels computed from data are different for every time. So, keep only recently used ones.
+    while len(_cmap_norms) > MAX_CMAP_NORMS:
+        _cmap_norms.popitem(last=False)
+
+    return _cmap_norms[key]
+
+
 def list_proj():
     # https://www.icsm.gov.au/education/fundamentals-mapping/projections/commonly-used-map-projections
     # https://pro.arcgis.com/en/pro-app/2.8/help/mapping/properties/plate-carree.htm
@@ -95,9 +174,7 @@ def get_auto_resolution(data):
         integer: integer value that would be used for extracting ndarray data at particular intervals
     """
 
-    fig = plt.gcf()
-    size = fig.get_size_inches()  # size in pixels
-    x_size = int(size[0])
+    x_size = int(FIG_SIZE[0])
     x_data = data.shape
     thin = int(x_data[0] / x_size) - 2
 
@@ -108,6 +185,143 @@ def get_auto_resolution(data):
     return thin
 
 
+def get_coarsen_factor(shape, dpi):
+    """Find factor by which a grid can be coarsened without going below pixel density of the plotted image
+
+    Map of the grid is sized by ``get_fig_layout`` for the aspect ratio of the grid, as grid spacing of WRF model is
+    same along both directions. Factor is rounded to the nearest integer.
+
+    Args:
+        shape (tuple): Shape of the grid as (south_north, west_east)
+        dpi (int): Resolution of the saved image
+
+    Returns:
+        integer: Number of grid points along each direction to be merged into one. 1 when grid has about as many points
+        as the pixels of the map or fewer.
+    """
+    fig_size, ax_rect, _ = get_fig_layout(shape[-2] / max(1, shape[-1]))
+    x_pixels = max(1, fig_size[0] * ax_rect[2] * dpi)
+    y_pixels = max(1, fig_size[1] * ax_rect[3] * dpi)
+    factor = int(round(min(shape[-1] / x_pixels, shape[-2] / y_pixels)))
+
+    return max(1, factor)
+
+
+def get_fig_layout(aspect, cbar=True):
+    """Find size of figure and placement of map and colour bar in it for aspect ratio of a map
+
+    Map takes as much of MAP_BOX as its aspect ratio allows. Figure is then sized to hold the map, the colour bar and
+    fixed margins, so that saved images need no cropping to their tight bounding box.
+
+    Args:
+        aspect (float): Height of the map divided by its width
+        cbar (bool): True to leave room for colour bar right of the map
+
+    Returns:
+        tuple: Figure size in inches, rectangles of map and colour bar as [left, bottom, width, height] in figure
+        coordinates. Rectangle of colour bar is None when ``cbar`` is False.
+    """
+    left, bottom, right, top = MAP_MARGINS
+    box_width = MAP_BOX[0]
+    if cbar:
+        box_width = (box_width - CBAR_PAD) / (1.0 + CBAR_WIDTH)
+    width = min(box_width, MAP_BOX[1] / aspect)
+    height = width * aspect
+    cbar_width = width * CBAR_WIDTH
+    fig_width = left + width + right
+    if cbar:
+        fig_width = left + width + CBAR_PAD + cbar_width + CBAR_MARGIN
+    fig_height = bottom + height + top
+
+    ax_rect = [left / fig_width, bottom / fig_height, width / fig_width, height / fig_height]
+    cax_rect = None
+    if cbar:
+        cax_rect = [
+            (left + width + CBAR_PAD) / fig_width,
+            bottom / fig_height,
+            cbar_width / fig_width,
+            height / fig_height,
+        ]
+
+    return (fig_width, fig_height), ax_rect, cax_rect
+
+
+def coarsen(data, factor, method="mean"):
+    """Coarsen last two dimensions of an array by merging blocks of grid points
+
+    Rows and columns left over at the end after making complete blocks are merged into a smaller block. Missing values
+    are ignored within a block.
+
+    Args:
+        data (ndarray): Array with (south_north, west_east) as last two dimensions
+        factor (int): Number of grid points along each direction to be merged into one
+        method (str): 'mean' to average blocks or 'max' to keep maximum of blocks (e.g. reflectivity)
+
+    Returns:
+        ndarray: Coarsened array
+    """
+    data = np.ma.asarray(data)
+    # Keep single precision data in single precision
+    data = np.asarray(np.ma.filled(data.astype(np.result_type(data.dtype, np.float32)), np.nan))
+    if factor <= 1:
+        return data
+    # Last blocks are filled up with missing values
+    pad = [(0, 0)] * (data.ndim - 2) + [(0, -data.shape[-2] % factor), (0, -data.shape[-1] % factor)]
+    data = np.pad(data, pad, constant_values=np.nan)
+    ny, nx = data.shape[-2:]
+    blocks = data.reshape(data.shape[:-2] + (ny // factor, factor, nx // factor, factor))
+    with warnings.catch_warnings():
+        # Blocks having only missing values result in NaN with a warning
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        if method == "max":
+            return np.nanmax(blocks, axis=(-3, -1))
+
+        return np.nanmean(blocks, axis=(-3, -1))
+
+
+def coarsen_lons(lons, factor):
+    """Coarsen longitudes by averaging blocks. Blocks crossing the dateline are averaged without wrapping around."""
+    lons = np.asarray(lons)
+    if factor <= 1:
+        return lons
+    # Longitudes relative to the first grid point are continuous across the dateline
+    ref = lons[..., :1, :1]
+
+    return coarsen((lons - ref + 180.0) % 360.0 - 180.0, factor) + ref
+
+
+def coarsen_coords(lons, lats, factor):
+    """Coarsen longitudes and latitudes of a grid keeping its outer edges
+
+    Points of coarsened grid are centres of blocks except for its outer rows and columns, which lie on the outer rows
+    and columns of the grid. So, coarsened data covers the same extent as the grid.
+
+    Args:
+        lons (ndarray): Longitudes with (south_north, west_east) as last two dimensions
+        lats (ndarray): Latitudes with (south_north, west_east) as last two dimensions
+        factor (int): Number of grid points along each direction to be merged into one
+
+    Returns:
+        tuple: Coarsened longitudes and latitudes
+    """
+    lons, lats = np.asarray(lons), np.asarray(lats)
+    if factor <= 1:
+        return lons, lats
+    edges = []
+    for coord in (lons, lats):
+        coord = np.array(coord, dtype=np.result_type(coord.dtype, np.float32))
+        # First and last blocks along each direction are made of the outer row or column alone
+        last_y = ((coord.shape[-2] - 1) // factor) * factor
+        last_x = ((coord.shape[-1] - 1) // factor) * factor
+        coord[..., :factor, :] = coord[..., :1, :]
+        coord[..., last_y:, :] = coord[..., -1:, :]
+        coord[..., :factor] = coord[..., :1]
+        coord[..., last_x:] = coord[..., -1:]
+        edges.append(coord)
+
+    return coarsen_lons(edges[0], factor), coarsen(edges[1], factor)
+
+
 def get_auto_range_calc(max, min, step):
     """Calculate range of data according to input data and not list
 
@@ -129,32 +343,65 @@ def dir_to_list_files(path):
     """Function to return list of files for a given directory
 
     Args:
-        path (str): Path to directory or file(s) or file
+        path (str): Path to directory, glob pattern (e.g. 'wrfout_d01_*') or file(s) separated by ','
 
     Returns:
         list: List containing path to files
     """
 
     _in_files = []
-    if os.path.isdir(path):
-        _files = os.listdir(path)
-        for _file in _files:
-            _in_files.append(os.path.join(path, _file))
-    else:
-        _in_files = path.split(",")
+    for _path in path.split(","):
+        _path = os.path.expanduser(_path.strip())
+        if os.path.isdir(_path):
+            for _file in sorted(os.listdir(_path)):
+                if os.path.isfile(os.path.join(_path, _file)):
+                    _in_files.append(os.path.join(_path, _file))
+        elif glob.has_magic(_path):
+            _in_files.extend(sorted(glob.glob(_path)))
+        elif _path:
+            _in_files.append(_path)
 
     return _in_files
 
 
-def get_clevels(var_name=None, clevels=False, data=False):
-    config = configparser.ConfigParser()
-    config.read(os.path.join(data_dir(), "wrf_variables.ini"))
+def bbox_to_window(lats, lons, bbox):
+    """Find index window of the grid covering a bounding box
+
+    Args:
+        lats (numpy array): 2D latitudes of the grid
+        lons (numpy array): 2D longitudes of the grid
+        bbox (list): Bounding box as [lon0, lon1, lat0, lat1]
+
+    Returns:
+        tuple: (south_north start, stop, west_east start, stop) with stop excluded or None when no grid point falls
+        inside the bounding box
+    """
+    lon0, lon1, lat0, lat1 = bbox
+    inside = (lons >= lon0) & (lons <= lon1) & (lats >= lat0) & (lats <= lat1)
+    rows = np.flatnonzero(inside.any(axis=1))
+    cols = np.flatnonzero(inside.any(axis=0))
+    if len(rows) == 0 or len(cols) == 0:
+        return None
+
+    return int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+
+
+def get_clevels(spec, clevels=False, data=False):
+    """Get contour levels of a variable
+
+    Args:
+        spec (VariableSpec): Plotting defaults of the variable from registry of variables
+        clevels: Levels provided by user as list, number of levels as int or False to use default levels
+        data (ndarray): Data used for computing levels automatically
+
+    Returns:
+        list: Contour levels
+    """
     _clevels = clevels
     if clevels is False:
-        default_clevels = config.get(var_name, "clevels")
-        if ',' in default_clevels:
-            _clevels = list(map(int, default_clevels.split(',')))
-        elif default_clevels == "auto":
+        if isinstance(spec.clevels, tuple):
+            _clevels = list(spec.clevels)
+        elif spec.clevels == "auto":
             _clevels = get_auto_clevel(data)
     elif isinstance(clevels, int):
         _clevels = get_auto_clevel(data, scale=int(clevels))
@@ -164,11 +411,10 @@ def get_clevels(var_name=None, clevels=False, data=False):
     return _clevels
 
 
-def get_cbar_extend(var_name):
-    config = configparser.ConfigParser()
-    config.read(os.path.join(data_dir(), "wrf_variables.ini"))
+def get_cbar_extend(spec):
+    """Get colour bar extension of a variable from its plotting defaults"""
 
-    return config.get(var_name, "c_bar_extend")
+    return spec.c_bar_extend
 
 
 def get_auto_clevel(data, scale=12, slp=False):
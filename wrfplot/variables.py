@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+""" Registry of variables supported by the application and their plotting defaults """
+"""
+This file is part of wrfplot application.
+
+wrfplot is free software: you can redistribute it and/or modify it under the terms of the GNU General Public License as
+ published by the Free Software Foundation, either version 3 of the License, or any later version.
+
+wrfplot is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along with wrfplot. If not,
+see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "J Sundar (wrf.guy@gmail.com)"
+
+import os
+import configparser
+from types import MappingProxyType
+from typing import NamedTuple, Tuple, Union
+import utils
+
+_registry = None
+
+
+class VariableSpec(NamedTuple):
+    """Plotting defaults of a variable as read from 'wrf_variables.ini'"""
+
+    name: str
+    title: str
+    unit: str
+    cmap: str
+    # Contour levels as numbers, 'auto' for levels computed from data or None when not set
+    clevels: Union[Tuple[float, ...], str, None]
+    c_bar_extend: str
+    clabel: bool
+    # 'mean' or 'max' of blocks of grid points when coarsening grid
+    coarsen: str = "mean"
+
+
+def parse_clevels(clevels):
+    """Convert contour levels from config file to numbers
+
+    Args:
+        clevels (str): Levels separated by ',', 'auto' or 'None'
+
+    Returns:
+        tuple: Contour levels, 'auto' or None
+    """
+    clevels = clevels.strip()
+    if "," in clevels:
+        return tuple(
+            int(level) if level.strip().lstrip("-").isdigit() else float(level)
+            for level in clevels.split(",")
+        )
+    elif clevels == "auto":
+        return clevels
+
+    return None
+
+
+def read_registry(path=None):
+    """Read variables and their plotting defaults from config file
+
+    Args:
+        path (str): Path to config file. Default is 'wrf_variables.ini' in data directory.
+
+    Returns:
+        MappingProxyType: Read only mapping of variable name to ``VariableSpec``
+    """
+    if path is None:
+        path = os.path.join(utils.data_dir(), "wrf_variables.ini")
+    config = configparser.ConfigParser()
+    config.read(path)
+    registry = {}
+    for name in config.sections():
+        section = config[name]
+        registry[name] = VariableSpec(
+            name=name,
+            title=section.get("title"),
+            unit=section.get("unit"),
+            cmap=section.get("cmap"),
+            clevels=parse_clevels(section.get("clevels", "None")),
+            c_bar_extend=section.get("c_bar_extend"),
+            clabel=section.getboolean("clable", fallback=True),
+            coarsen=section.get("coarsen", "mean"),
+        )
+
+    return MappingProxyType(registry)
+
+
+def get_registry():
+    """Get registry of variables. Config file is read only once and shared afterwards."""
+    global _registry
+    if _registry is None:
+        _registry = read_registry()
+
+    return _registry
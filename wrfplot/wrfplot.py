@@ -20,13 +20,14 @@ __author__ = "J Sundar (wrf.guy@gmail.com)"
 
 import os
 import sys
-import fileio
 import argparse
+import multiprocessing
 import arguments
-import wrf
+import cache
+import encoder
+import utils
 import timeit
 from importlib.metadata import version
-from core import WrfPlot
 import traceback
 
 
@@ -57,9 +58,6 @@ finally:
     # Do nothing
     pass
 
-# Enable cartopy using wrf moudule's inbuilt method
-wrf.enable_cartopy()
-
 
 def arg_praser():
     """Form command line input"""
@@ -76,9 +74,10 @@ def arg_praser():
     )
     parser.add_argument(
         "--input",
-        metavar="<input_file>",
-        type=arguments.file_path,
-        help="Path to WRF generated netCDF.",
+        metavar="<input_file(s)>",
+        type=arguments.input_paths,
+        help="Path to WRF generated netCDF. Multiple files can be provided as a directory, a glob pattern i.e., "
+        "'wrfout_d01_*' or paths separated by ','. Times of all files are plotted in time order.",
     )
     parser.add_argument(
         "--output",
@@ -128,6 +127,30 @@ def arg_praser():
         action="store_true",
         help="Disable contour label. This will not have an effect on variable 'slp'.",
     )
+    parser.add_argument(
+        "--times",
+        metavar="<forecast-hours>",
+        type=arguments.validate_times,
+        default=None,
+        help="Plot only selected forecast hours counted from the first time. Hours, ranges and ranges with a step "
+        "are to be separated by ',' i.e., '0-48:3' for every 3rd hour up to 48 hours or '0,6,12'.",
+    )
+    parser.add_argument(
+        "--valid",
+        metavar="<valid-times>",
+        type=arguments.validate_valid,
+        default=None,
+        help="Plot only selected valid times separated by ',' i.e., '2021-05-13T12,2021-05-13T18:30'. Can be combined "
+        "with '--times'.",
+    )
+    parser.add_argument(
+        "--bbox",
+        metavar="<lon0,lon1,lat0,lat1>",
+        type=arguments.validate_bbox,
+        default=None,
+        help="Plot only the sub-region of the domain covering given bounding box in degrees i.e., '70,90,5,25'. Only "
+        "the sub-region is read from input file(s) and used for computing diagnostics.",
+    )
     parser.add_argument(
         "--dpi",
         metavar="<value>",
@@ -136,6 +159,113 @@ def arg_praser():
         help="Increase or decrease the plotted image resolution. Default is 125. More is higher resolution and less is "
         "course resolution. Higher values will reduce the speed of plot.",
     )
+    parser.add_argument(
+        "--coarsen",
+        metavar="<factor>",
+        type=arguments.validate_coarsen,
+        default=None,
+        help="Merge blocks of <factor> x <factor> grid points before plotting. Default is 'auto' which coarsens only "
+        "when the grid has more points than the pixels of the image. Use 1 to disable.",
+    )
+    parser.add_argument(
+        "--render",
+        metavar="<mode>",
+        choices=["contour", "raster"],
+        default="contour",
+        help="How fields are drawn. Default is 'contour' which draws filled contours with contour lines and labels. "
+        "'raster' colours each grid cell by its contour level without tracing contours, which is much faster for "
+        "quick looks at large grids.",
+    )
+    parser.add_argument(
+        "--format",
+        metavar="<format>",
+        type=arguments.validate_format,
+        default="png",
+        help="Format of saved images i.e., %s. Default is 'png'. 'webp', 'jpeg' and 'avif' are lossy formats making "
+        "files several times smaller. Animations are saved as GIF for 'png' and 'jpeg' and in the same format as "
+        "images for 'webp' and 'avif'." % ", ".join(encoder.FORMATS),
+    )
+    parser.add_argument(
+        "--quality",
+        metavar="<value>",
+        type=arguments.validate_quality,
+        default=None,
+        help="Quality of lossy formats from 1 to 100. Higher values make better images and larger files. Defaults "
+        "are %s." % ", ".join("%d for '%s'" % (q, f) for f, q in encoder.QUALITY.items()),
+    )
+    parser.add_argument(
+        "--tiles",
+        metavar="<zoom-levels>",
+        type=arguments.validate_zooms,
+        default=None,
+        help="Cut fields into XYZ tiles of Web Mercator for web maps instead of saving maps, e.g. '4-9' for zoom levels "
+        "4 to 9. Tiles are saved as '<output>/tiles/<image name>/<z>/<x>/<y>.png' ('.webp' with '--format webp') "
+        "without title, colour bar, coastlines or grid lines. Tiles having nothing plotted are not saved.",
+    )
+    parser.add_argument(
+        "--export",
+        metavar="<format>",
+        type=arguments.validate_export,
+        default=None,
+        help="Write fields as data in native projection of WRF instead of plotting maps. 'geotiff' writes a tiled and "
+        "compressed GeoTIFF with overviews for each variable, level and time (needs 'rasterio' package). 'netcdf' "
+        "writes a compressed NetCDF file for each variable holding all selected times and levels.",
+    )
+    parser.add_argument(
+        "--png-compression",
+        metavar="<level>",
+        type=arguments.validate_png_compression,
+        default=encoder.PNG_COMPRESSION,
+        help="zlib compression level of PNG images from 0 to 9. Default is %d. Lower levels save faster but make "
+        "larger files, 0 saves without compression e.g. for images used only to make animations."
+        % encoder.PNG_COMPRESSION,
+    )
+    parser.add_argument(
+        "--png-palette",
+        action="store_true",
+        default=False,
+        help="Save images with a palette of %d colours instead of full colour, which makes files several times "
+        "smaller." % encoder.PALETTE_COLORS,
+    )
+    parser.add_argument(
+        "--shape-res",
+        metavar="<resolution>",
+        choices=["auto", "110m", "50m", "10m"],
+        default="auto",
+        help="Resolution of coastlines and country borders i.e., '110m', '50m' or '10m'. Default is 'auto' which uses "
+        "'110m' for continental domains and '10m' only for small high resolution domains based on the distance "
+        "covered by a pixel of the image.",
+    )
+    parser.add_argument(
+        "--preview",
+        action="store_true",
+        default=False,
+        help="Quick preview of plots with grid coarsened by a fixed factor of %d. Overrides '--coarsen'."
+        % utils.PREVIEW_COARSEN,
+    )
+    parser.add_argument(
+        "--precision",
+        metavar="<dtype>",
+        choices=["float64", "float32"],
+        default="float64",
+        help="Precision of data processed. 'float32' converts data to single precision while reading to halve the "
+        "memory used for large domains. Default is 'float64' which keeps data as stored in input file(s).",
+    )
+    parser.add_argument(
+        "--workers",
+        metavar="<number>",
+        type=arguments.validate_workers,
+        default=1,
+        help="Number of worker processes plotting times in parallel. Default is 1 which plots in the main process. "
+        "Use 'auto' for number of CPUs. Each worker keeps its own cache of '--cache-size'.",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        default=False,
+        help="Print the tasks (reads, diagnostics, interpolations, plots and animations) needed for plotting given "
+        "variables and exit without plotting. Tasks shared by variables are listed once.",
+    )
     parser.add_argument(
         "--gif",
         action="store_true",
@@ -151,6 +281,46 @@ def arg_praser():
         help="Set speed of GIF frame in seconds. Default is 0.5 sec. Lower value increases the speed of animation. To "
         "be used with '--gif' option to take effect.",
     )
+    parser.add_argument(
+        "--cache-size",
+        metavar="<MB>",
+        type=arguments.validate_cache_size,
+        default=cache.DEFAULT_CACHE_SIZE,
+        help="Maximum memory in MB used to keep computed fields (e.g. 'cape_2d', 'pressure') for reuse across "
+        "variables. Default is %d MB. Use 0 to disable." % cache.DEFAULT_CACHE_SIZE,
+    )
+    parser.add_argument(
+        "--extraction",
+        metavar="<mode>",
+        choices=["frame", "bulk"],
+        default="frame",
+        help="Data extraction mode. 'frame' (default) reads data one time at a time. 'bulk' reads a block of times "
+        "in a single call and serves every time from memory. Size of a block is limited by '--memory-budget'.",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        metavar="<MB>",
+        type=arguments.validate_cache_size,
+        default=cache.DEFAULT_MEMORY_BUDGET,
+        help="Maximum memory in MB used by a block of times in 'bulk' extraction mode. Default is %d MB. It can not "
+        "be more than '--cache-size'." % cache.DEFAULT_MEMORY_BUDGET,
+    )
+    parser.add_argument(
+        "--disk-cache",
+        metavar="<cache_dir>",
+        type=arguments.dir_path,
+        default=None,
+        help="Path to directory for keeping extracted data on disk. Repeated runs on the same input file (e.g. with "
+        "different '--cmap' or '--clevels') reuse the data instead of computing it again.",
+    )
+    parser.add_argument(
+        "--disk-cache-size",
+        metavar="<MB>",
+        type=arguments.validate_cache_size,
+        default=cache.DEFAULT_DISK_CACHE_SIZE,
+        help="Maximum disk space in MB used by '--disk-cache'. Least recently used data is removed beyond this size. "
+        "Default is %d MB." % cache.DEFAULT_DISK_CACHE_SIZE,
+    )
     parser.add_argument(
         "--version",
         action="store_true",
@@ -174,12 +344,27 @@ def main():
             "process.\nTypical usage will be \"wrfplot --input filename' --output 'path/to/output/dir' --vars 'slp'\""
         )
     elif all([args.input, args.vars, args.output]):
-        file = fileio.FileIO(args.input)
-        if file.is_wrf():
+        # Modules depending on wrf-python and cartopy are imported only for plotting so that listing options are quick
+        import wrf
+        import fileio
+        import planner
+        from core import WrfPlot
+
+        # Enable cartopy using wrf moudule's inbuilt method
+        wrf.enable_cartopy()
+        input_files = []
+        for input_file in args.input:
+            try:
+                if fileio.FileIO(input_file).is_wrf():
+                    input_files.append(input_file)
+                    continue
+            except OSError:
+                pass
+            print(f"Skipping {input_file} as it is not a WRF model output file...")
+        if len(input_files) > 0:
             # start_time = time.monotonic()
             start_time = timeit.default_timer()
-            wrfplt = WrfPlot(
-                input_path=args.input,
+            options = dict(
                 output_path=args.output,
                 dpi=args.dpi,
                 cmap=args.cmap,
@@ -188,19 +373,61 @@ def main():
                 animation_speed=args.gif_speed,
                 clevels=args.clevels,
                 dis_clabel=args.no_clabel,
+                cache_size=args.cache_size,
+                extraction=args.extraction,
+                memory_budget=args.memory_budget,
+                disk_cache_dir=args.disk_cache,
+                disk_cache_size=args.disk_cache_size,
+                coarsen=utils.PREVIEW_COARSEN if args.preview else args.coarsen,
+                precision=args.precision,
+                shape_res=args.shape_res,
+                render=args.render,
+                png_compression=args.png_compression,
+                png_palette=args.png_palette,
+                fig_format=args.format,
+                quality=args.quality,
+                tiles=args.tiles,
+                export=args.export,
             )
+            wrfplt = WrfPlot(input_path=input_files, **options)
             try:
-                wrfplt.read_file(args.input)
-                if isinstance(args.vars, list):
-                    wrfplt.total_vars = len(args.vars)
-                    for var in args.vars:
-                        wrfplt.set_variable(var)
-                        wrfplt.plot.create_fig(wrfplt.proj)
-                        wrfplt.plot_variable(var_name=var)
+                wrfplt.read_file(input_files)
+                if len(wrfplt.select_times(hours=args.times, valid=args.valid)) == 0:
+                    sys.exit(
+                        "None of the times selected with '--times' or '--valid' options are available in input file(s)."
+                    )
+                if args.bbox is not None and wrfplt.set_bbox(args.bbox) is None:
+                    sys.exit(
+                        "None of the grid points of input file(s) fall inside the bounding box given with '--bbox' option."
+                    )
+                var_names = args.vars if isinstance(args.vars, list) else [args.vars]
+                graph = planner.plan(wrfplt, var_names)
+                if args.plan:
+                    print(graph.describe(wrfplt.get_time_period()))
+                    sys.exit()
+                workers = args.workers
+                if args.export == "netcdf" and workers > 1:
+                    # Each NetCDF file holds all times of a variable and cannot be written by several processes
+                    print("Data is exported to NetCDF files in a single process. Ignoring '--workers' option...")
+                    workers = 1
+                if workers > 1:
+                    import parallel
+
+                    executor = parallel.PoolExecutor(
+                        workers=workers,
+                        options=options,
+                        input_files=input_files,
+                        hours=args.times,
+                        valid=args.valid,
+                        bbox=args.bbox,
+                    )
                 else:
-                    wrfplt.set_variable(args.vars)
-                    wrfplt.plot.create_fig(wrfplt.proj)
-                    wrfplt.plot_variable(var_name=args.vars)
+                    executor = planner.SerialExecutor()
+                planner.run(wrfplt, graph, executor)
+                wrfplt.close_export()
+                print("\n" + wrfplt.field_cache.summary())
+                if wrfplt.disk_cache is not None:
+                    print(wrfplt.disk_cache.summary())
                 total_time = timeit.default_timer() - start_time
                 mins, secs = divmod(total_time, 60)
                 hours, mins = divmod(mins, 60)
@@ -215,4 +442,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Worker processes of '--workers' option need it when running from freeze mode
+    multiprocessing.freeze_support()
     main()